@@ -0,0 +1,77 @@
+#!/usr/bin/python
+#
+# Micro-benchmark of per-test aggregation in parse_new_cbt.py: the vectorized
+# weighted_average() kernel against the original per-key np.ma.average loops
+#
+# Orlando Moreno
+
+import sys
+import time
+import argparse
+import numpy as np
+import parse_new_cbt
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark per-test latency aggregation.')
+    parser.add_argument('-o', '--outputs', dest='outputs', type=int, default=50, help='Outputs (client volumes) per test (default: 50).')
+    parser.add_argument('-k', '--pctiles', dest='pctiles', type=int, default=17, help='Percentile keys per output (default: 17).')
+    parser.add_argument('-n', '--repeat', dest='repeat', type=int, default=200, help='Aggregations to time per implementation (default: 200).')
+    args = parser.parse_args()
+    return args
+
+# Stand-in for parse_new_cbt.Output with random fio-like latencies (ns)
+class FakeOutput(object):
+    def __init__(self, rng, keys):
+        self.read_iops = int(rng.integers(1000, 20000))
+        self.write_iops = int(rng.integers(1000, 20000))
+        self.read_lat = dict((key, float(rng.uniform(1e5, 1e7))) for key in keys)
+        self.write_lat = dict((key, float(rng.uniform(1e5, 1e7))) for key in keys)
+
+# The aggregation loops of Test.calculate_results before the vectorized kernel
+def legacy_aggregate(outputs):
+    read_lat = {}
+    write_lat = {}
+    lat = {}
+    read_iops = sum([item.read_iops for item in outputs])
+    write_iops = sum([item.write_iops for item in outputs])
+    for key in outputs[0].read_lat.keys():
+        read_lat[key] = np.ma.average([item.read_lat[key] for item in outputs], weights=[item.read_iops for item in outputs])
+        read_lat[key] /= 1000000
+    for key in outputs[0].write_lat.keys():
+        write_lat[key] = np.ma.average([item.write_lat[key] for item in outputs], weights=[item.write_iops for item in outputs])
+        write_lat[key] /= 1000000
+    for key in outputs[0].read_lat.keys():
+        lat[key] = np.ma.average([read_lat[key], write_lat[key]], weights=[read_iops, write_iops])
+    return read_lat, write_lat, lat
+
+def vector_aggregate(outputs):
+    read_iops = sum([item.read_iops for item in outputs])
+    write_iops = sum([item.write_iops for item in outputs])
+    read_lat = dict((key, value / 1000000) for key, value in parse_new_cbt.weighted_average([item.read_lat for item in outputs], [item.read_iops for item in outputs]).items())
+    write_lat = dict((key, value / 1000000) for key, value in parse_new_cbt.weighted_average([item.write_lat for item in outputs], [item.write_iops for item in outputs]).items())
+    lat = parse_new_cbt.weighted_average([read_lat, write_lat], [read_iops, write_iops])
+    return read_lat, write_lat, lat
+
+def bench(fn, outputs, repeat):
+    start = time.perf_counter()
+    for i in range(repeat):
+        result = fn(outputs)
+    return (time.perf_counter() - start) / repeat, result
+
+if __name__ == '__main__':
+    ctx = parse_args()
+    rng = np.random.default_rng(0)
+    keys = ['avg', 'min', 'max'] + [round(float(pct), 2) for pct in np.linspace(1, 99.99, ctx.pctiles)]
+    outputs = [FakeOutput(rng, keys) for i in range(ctx.outputs)]
+
+    legacy_time, legacy = bench(legacy_aggregate, outputs, ctx.repeat)
+    vector_time, vector = bench(vector_aggregate, outputs, ctx.repeat)
+    identical = all(legacy[i][key] == vector[i][key] for i in range(3) for key in keys)
+
+    print('outputs/test: %d, latency keys: %d' % (ctx.outputs, len(keys)))
+    print('np.ma.average loops: %10.1f usec/test' % (legacy_time * 1e6))
+    print('vectorized kernel:   %10.1f usec/test' % (vector_time * 1e6))
+    print('speedup:             %10.1fx' % (legacy_time / vector_time))
+    print('identical results:   %10s' % identical)
+    if not identical:
+        sys.exit(1)
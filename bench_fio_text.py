@@ -0,0 +1,125 @@
+#!/usr/bin/python
+#
+# Throughput benchmark (lines/sec) of the fio text tokenizer in fio_text.py
+# against the original per-line regex loop of parse_cbt.py, on a large
+# synthetic fio text output. Runs under Python 2 and Python 3.
+#
+# Orlando Moreno
+
+from __future__ import print_function
+import re
+import sys
+import time
+import random
+import argparse
+from fio_text import convert_unit, parse_iothreads
+
+def parse_args():
+	parser = argparse.ArgumentParser(description='Benchmark the fio text output parser.')
+	parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=20000, help='fio jobs in the synthetic output (default: 20000).')
+	parser.add_argument('-n', '--repeat', dest='repeat', type=int, default=3, help='Timed passes per parser, best is reported (default: 3).')
+	args = parser.parse_args()
+	return args
+
+PCTS = ['1.00', '5.00', '10.00', '20.00', '30.00', '40.00', '50.00', '60.00', '70.00', '80.00', '90.00', '95.00', '99.00', '99.50', '99.90', '99.95', '99.99']
+
+def synthetic_output(jobs):
+	rng = random.Random(0)
+	lines = ['fio-3.1\n', 'Starting %d processes\n' % jobs]
+	for n in range(jobs):
+		lines.append('client1: (groupid=0, jobs=1): err= 0: pid=%d: Thu Jul 30 10:00:00 2020\n' % (1000 + n))
+		for block in ('read', 'write'):
+			iops = rng.randint(500, 30000)
+			lines.append('  %5s: IOPS=%s, BW=%dKiB/s (%dkB/s)(%dMiB/300001msec)\n' % (block, '%.1fk' % (iops / 1000.0) if iops >= 10000 else iops, iops * 4, iops * 4.096, iops * 1.2))
+			lines.append('    slat (nsec): min=1000, max=5000, avg=2000.00, stdev=100.00\n')
+			lines.append('    clat (usec): min=%d, max=%d, avg=%.2f, stdev=%.2f\n' % (200, 80000, rng.uniform(400, 5000), 300.0))
+			lines.append('     lat (usec): min=%d, max=%dk, avg=%.2f, stdev=%.2f\n' % (210, 80, rng.uniform(400, 5000), 301.0))
+			lines.append('    clat percentiles (usec):\n')
+			cells = ['%5sth=[%5d]' % (pct, rng.randint(100, 90000)) for pct in PCTS]
+			for i in range(0, len(cells), 4):
+				lines.append('     | ' + ', '.join(cells[i:i + 4]) + (',\n' if i + 4 < len(cells) else '\n'))
+			lines.append('   bw (  KiB/s): min= 1000, max= 9000, per=10.00%, avg=4000.00, stdev=100.00, samples=600\n')
+			lines.append('   iops        : min=  250, max= 2250, avg=1000.00, stdev=25.00, samples=600\n')
+		lines.append('  lat (usec)   : 250=0.01%, 500=1.00%, 750=10.00%, 1000=50.00%\n')
+		lines.append('  cpu          : usr=1.00%, sys=2.00%, ctx=100000, majf=0, minf=100\n')
+		lines.append('  IO depths    : 1=0.1%, 2=0.1%, 4=0.1%, 8=0.1%, 16=0.1%, 32=99.9%, >=64=0.0%\n')
+	lines.append('\n')
+	lines.append('Run status group 0 (all jobs):\n')
+	return lines
+
+# The parse loop of Output.parseFIO in parse_cbt.py before the tokenizer
+def legacy_iothreads(lines):
+	iothreads = []
+	curthread = -1
+	block = 'read'
+	pct_unit = 'msec'
+
+	for line in lines:
+		if re.search('pid=\d+', line):
+			curthread += 1
+			iothread = {}
+			iothread['pid'] = re.search('\spid=\d+', line).group(0).split('=')[1]
+			iothread.update(dict.fromkeys(['read_iops', 'read_bw', 'read_runt', 'read_avglat', 'read_minlat', 'read_maxlat','read_stdev'], 0))
+			iothread['read_pctiles'] = {}
+			iothread.update(dict.fromkeys(['write_iops', 'write_bw', 'write_runt', 'write_avglat', 'write_minlat', 'write_maxlat', 'write_stdev'], 0))
+			iothread['write_pctiles'] = {}
+			iothread['thread_pctiles'] = {}
+			iothreads.append(iothread)
+
+		m = re.match('\s+(?P<block>read|write)\s*: IOPS=(?P<iops>\d+[\.\d]*k*), BW=(?P<biw>\d+[\.\d]*)(?P<biw_unit>\S+) \((?P<bw>\d+[\.\d]*)(?P<bw_unit>\S+)\)\((?P<io>\d+)(?P<io_unit>\S+)/(?P<runt>\d+)(?P<runt_unit>\S+)\)', line)
+		if m:
+			block = m.groupdict()['block']
+			if "k" in m.groupdict()['iops']:
+				iothreads[curthread][block + '_iops'] = float(m.groupdict()['iops'].split('k')[0]) * 1000
+			else:
+				iothreads[curthread][block + '_iops'] = int(m.groupdict()['iops'])
+			iothreads[curthread][block + '_bw'] = float(m.groupdict()['bw']) * convert_unit(m.groupdict()['bw_unit']) / 1000
+			iothreads[curthread][block + '_runt'] = float(m.groupdict()['runt']) /  convert_unit(m.groupdict()['runt_unit']) * 1000
+
+		m = re.match('\s+lat \((?P<unit>\S+)\):\s+min=\s*(?P<min>\d+[\.\d]*), max=\s*(?P<max>\d+[\.\d]*k*), avg=\s*(?P<avg>\d+[\.\d]*), stdev=\s*(?P<stdev>\d+[\.\d]*)', line)
+		if m:
+			mult = convert_unit(m.groupdict()['unit'])
+			iothreads[curthread][block + '_minlat'] = float(m.groupdict()['min']) /  mult * 1000
+			if "k" in m.groupdict()['max']:
+				iothreads[curthread][block + '_maxlat'] = float(m.groupdict()['max'].split('k')[0]) * 1000 / mult * 1000
+			else:
+				iothreads[curthread][block + '_maxlat'] = float(m.groupdict()['max']) / mult * 1000
+			iothreads[curthread][block + '_avglat'] = float(m.groupdict()['avg']) / mult * 1000
+			iothreads[curthread][block + '_stdev'] = float(m.groupdict()['stdev']) / mult * 1000
+		m = re.match('\s+clat percentiles \((?P<unit>\S+)\):', line)
+		if m:
+			pct_unit = m.groupdict()['unit']
+		m = re.match('\s+\|\s+\d+[\.\d]*th=', line)
+		if m:
+			for pct in line.split(','):
+				pctile = re.match('\s+[\|\s]*(?P<bucket>\d+[\.\d]*)th=\[\s*(?P<value>\d+[\.\d]*)\]', pct)
+				if pctile:
+					bucket = pctile.groupdict()['bucket']
+					value = float(pctile.groupdict()['value']) / convert_unit(pct_unit) * 1000
+					iothreads[curthread][block + '_pctiles'][bucket] = value
+	return iothreads
+
+def bench(fn, lines, repeat):
+	best = None
+	for i in range(repeat):
+		start = time.time()
+		result = fn(lines)
+		elapsed = time.time() - start
+		if best is None or elapsed < best:
+			best = elapsed
+	return best, result
+
+if __name__ == '__main__':
+	ctx = parse_args()
+	lines = synthetic_output(ctx.jobs)
+
+	legacy_time, legacy = bench(legacy_iothreads, lines, ctx.repeat)
+	token_time, tokens = bench(parse_iothreads, lines, ctx.repeat)
+
+	print('lines: %d, jobs: %d' % (len(lines), ctx.jobs))
+	print('per-line regex: %12.0f lines/sec' % (len(lines) / legacy_time))
+	print('tokenizer:      %12.0f lines/sec' % (len(lines) / token_time))
+	print('speedup:        %12.1fx' % (legacy_time / token_time))
+	print('identical:      %12s' % (legacy == tokens))
+	if legacy != tokens:
+		sys.exit(1)
@@ -0,0 +1,48 @@
+#!/usr/bin/python
+#
+# Memory benchmark for parse_new_cbt.py: bytes held per Output and per Test
+# once every test of an archive is loaded
+#
+# Orlando Moreno
+
+import os
+import gc
+import argparse
+import tracemalloc
+import parse_new_cbt
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Measure memory held by parsed CBT tests.')
+    parser.add_argument('-a', '--args', dest='args', default='', help='Extra parse_new_cbt.py options, e.g. "--hist -p".')
+    parser.add_argument('DIR', help='CBT archive directory to load')
+    args = parser.parse_args()
+    return args
+
+def load_archive(ctx, dn):
+    tests = []
+    for test_dir in parse_new_cbt.ArchiveIndex().scan(dn):
+        if isinstance(test_dir, parse_new_cbt.TestDir):
+            benchConfig = parse_new_cbt.load_config_file(os.path.join(test_dir.path, parse_new_cbt.BENCHMARK_CONFIG))
+            tests.append(parse_new_cbt.load_test(ctx, dn, test_dir, benchConfig, test_dir.hashid))
+    return tests
+
+if __name__ == '__main__':
+    args = parse_args()
+    ctx = parse_new_cbt.parse_args([args.DIR] + args.args.split())
+
+    # Warm up module-level state (interned layouts, numpy internals) before measuring
+    load_archive(ctx, args.DIR)
+    gc.collect()
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    tests = load_archive(ctx, args.DIR)
+    gc.collect()
+    held = tracemalloc.get_traced_memory()[0] - before
+    tracemalloc.stop()
+
+    outputs = sum(len(test.outputs) for test in tests)
+    print('tests: %d, outputs: %d' % (len(tests), outputs))
+    print('held:       %12d bytes' % held)
+    print('per test:   %12d bytes' % (held / max(len(tests), 1)))
+    print('per output: %12d bytes' % (held / max(outputs, 1)))
@@ -0,0 +1,146 @@
+#!/usr/bin/python
+#
+# Per-stage benchmark of the CBT parsers: wall/CPU time, files/sec and peak RSS
+# for discovery, YAML load, JSON/text parse, aggregation and output.
+#
+# Use gen_cbt_archive.py to build archives of a known size, e.g.
+#   ./gen_cbt_archive.py -l both -i 3 /tmp/archive
+#   python3 bench_parsers.py /tmp/archive/new
+#   python2 bench_parsers.py --legacy /tmp/archive/legacy
+#
+# Orlando Moreno
+
+from __future__ import print_function
+import os
+import sys
+import time
+import json
+import argparse
+import resource
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of a CBT archive parse.')
+    parser.add_argument('--legacy', dest='legacy', action='store_true', default=False, help='Benchmark parse_cbt.py (fio text layout, Python 2) instead of parse_new_cbt.py.')
+    parser.add_argument('-a', '--args', dest='args', default='', help='Extra parser options, e.g. "-s -p".')
+    parser.add_argument('-o', '--json', dest='json', default=None, help='Also write the results to this JSON file.')
+    parser.add_argument('DIR', help='CBT archive directory to parse')
+    args = parser.parse_args()
+    return args
+
+def peak_rss():
+    # ru_maxrss is in KB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+
+class Stage(object):
+    def __init__(self, results, name):
+        self.results = results
+        self.name = name
+        self.files = 0
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.cpu = time.clock() if sys.version_info[0] < 3 else time.process_time()
+        return self
+
+    def __exit__(self, *exc):
+        cpu = time.clock() if sys.version_info[0] < 3 else time.process_time()
+        wall = time.time() - self.wall
+        self.results.append({'stage': self.name, 'wall': wall, 'cpu': cpu - self.cpu, 'files': self.files,
+                             'files_per_sec': self.files / wall if wall > 0 else 0, 'peak_rss': peak_rss()})
+
+def bench_new(ctx_args, dn):
+    import parse_new_cbt
+    ctx = parse_new_cbt.parse_args([dn] + ctx_args)
+    results = []
+
+    with Stage(results, 'discovery') as stage:
+        test_dirs = []
+        for test_dir in parse_new_cbt.ArchiveIndex().scan(dn):
+            if isinstance(test_dir, parse_new_cbt.TestDir):
+                outputs = [os.path.join(test_dir.path, output[0]) for output in test_dir.outputs]
+                test_dirs.append((test_dir.path, outputs))
+        stage.files = len(test_dirs) + sum(len(outputs) for path, outputs in test_dirs)
+
+    with Stage(results, 'yaml load') as stage:
+        configs = []
+        for path, outputs in test_dirs:
+            configs.append(parse_new_cbt.load_config_file(os.path.join(path, parse_new_cbt.BENCHMARK_CONFIG)))
+        stage.files = len(configs)
+
+    with Stage(results, 'json parse') as stage:
+        tests = []
+        for (path, outputs), config in zip(test_dirs, configs):
+            test = parse_new_cbt.Test(ctx, dn, config['cluster'], os.path.basename(path), path)
+            for fn in outputs:
+                test.add_output(fn)
+            tests.append(test)
+        stage.files = sum(len(outputs) for path, outputs in test_dirs)
+
+    with Stage(results, 'aggregation') as stage:
+        for test in tests:
+            test.calculate_results()
+        stage.files = sum(len(test.outputs) for test in tests)
+
+    with Stage(results, 'output') as stage:
+        writer = parse_new_cbt.CsvWriter(open(os.devnull, 'w'), parse_new_cbt.output_columns(ctx))
+        writer.header()
+        tests.sort(key=lambda x: (x.metadata['benchmark'], x.metadata['rwmixread'], x.clients, x.metadata['op_size'], x.metadata['iteration'], x.metadata['iodepth']))
+        for test in tests:
+            writer.write(test.row())
+        writer.close()
+        stage.files = len(tests)
+    return results
+
+def bench_legacy(ctx_args, dn):
+    saved = sys.argv
+    sys.argv = ['parse_cbt.py', dn] + ctx_args
+    import parse_cbt
+    ctx = parse_cbt.parse_args()
+    sys.argv = saved
+    results = []
+
+    with Stage(results, 'discovery') as stage:
+        test_dirs = []
+        for path, dirs, files in os.walk(dn):
+            outputs = [os.path.join(path, f) for f in files if parse_cbt.OUTPUT_FILE.match(f)]
+            if outputs:
+                test_dirs.append((path, parse_cbt.parse_test_path(path), outputs))
+        stage.files = sum(len(outputs) for path, params, outputs in test_dirs)
+
+    with Stage(results, 'text parse') as stage:
+        testRun = parse_cbt.TestRun(ctx, os.devnull)
+        for path, params, outputs in test_dirs:
+            test = testRun.add_test(path, *params)
+            for fn in outputs:
+                test.add_output(fn)
+        stage.files = sum(len(outputs) for path, params, outputs in test_dirs)
+
+    # Test.print_test() aggregates before printing, so both are timed together
+    with Stage(results, 'aggregation+output') as stage:
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, 'w')
+        try:
+            testRun.print_testRun()
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+        stage.files = len(testRun.tests)
+    return results
+
+def print_results(results):
+    sys.stderr.write('%-20s %10s %10s %10s %12s %14s\n' % ('Stage', 'Wall(s)', 'CPU(s)', 'Files', 'Files/sec', 'PeakRSS(MB)'))
+    for row in results:
+        sys.stderr.write('%-20s %10.3f %10.3f %10d %12.0f %14.1f\n' % (row['stage'], row['wall'], row['cpu'], row['files'],
+                         row['files_per_sec'], row['peak_rss'] / 1048576.0))
+    sys.stderr.write('%-20s %10.3f %10.3f\n' % ('total', sum(row['wall'] for row in results), sum(row['cpu'] for row in results)))
+
+if __name__ == '__main__':
+    args = parse_args()
+    if args.legacy:
+        results = bench_legacy(args.args.split(), args.DIR)
+    else:
+        results = bench_new(args.args.split(), args.DIR)
+    print_results(results)
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'dir': args.DIR, 'legacy': args.legacy, 'args': args.args, 'python': sys.version.split()[0], 'stages': results}, f, indent=2)
@@ -0,0 +1,69 @@
+#!/usr/bin/python
+#
+# Files/sec of parse_new_cbt.py with and without --prefetch read-ahead, at simulated
+# network filesystem latencies. Every open() made by the parser first sleeps for the
+# given latency, like an NFS round trip; directory walks are not delayed.
+#
+#   ./gen_cbt_archive.py -i 3 /tmp/archive
+#   python3 bench_prefetch.py -l 0,1,5,20 -q 0,4,16,64 /tmp/archive/new
+#
+# Orlando Moreno
+
+import sys
+import time
+import json
+import argparse
+import builtins
+import parse_new_cbt
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Benchmark --prefetch at simulated file open latencies.')
+    parser.add_argument('-l', '--latencies', dest='latencies', default='0,1,5,20', help='Comma-seperated simulated latencies per open in ms (default: 0,1,5,20).')
+    parser.add_argument('-q', '--depths', dest='depths', default='0,4,16,64', help='Comma-seperated --prefetch queue depths; 0 is the synchronous parser (default: 0,4,16,64).')
+    parser.add_argument('-a', '--args', dest='args', default='', help='Extra parse_new_cbt.py options, e.g. "--lean-json".')
+    parser.add_argument('-o', '--json', dest='json', default=None, help='Also write the results to this JSON file.')
+    parser.add_argument('DIR', help='CBT archive directory to parse')
+    args = parser.parse_args()
+    return args
+
+def slow_open(latency):
+    def open(*args, **kwargs):
+        time.sleep(latency)
+        return builtins.open(*args, **kwargs)
+    return open
+
+def bench(args, latency, depth):
+    ctx = parse_new_cbt.parse_args([args.DIR, '--prefetch', str(depth)] + args.args.split())
+    parse_new_cbt.open = slow_open(latency / 1000.0)
+    # Configs are interned by content; start cold so every run reads and parses them
+    parse_new_cbt.CONFIGS.clear()
+    try:
+        start = time.time()
+        tests = parse_new_cbt.load_archive(ctx, args.DIR, parse_new_cbt.ArchiveIndex())
+        wall = time.time() - start
+    finally:
+        del parse_new_cbt.open
+    files = len(tests) + sum(len(test.outputs) for test in tests)
+    return {'latency_ms': latency, 'depth': depth, 'files': files, 'wall': wall, 'files_per_sec': files / wall if wall > 0 else 0}
+
+if __name__ == '__main__':
+    args = parse_args()
+    latencies = [float(latency) for latency in args.latencies.split(',')]
+    depths = [int(depth) for depth in args.depths.split(',')]
+    # Warm up the page cache and module state
+    bench(args, 0, 0)
+
+    results = []
+    sys.stderr.write('%12s %8s %8s %10s %12s %10s\n' % ('Latency(ms)', 'Depth', 'Files', 'Wall(s)', 'Files/sec', 'Speedup'))
+    for latency in latencies:
+        base = None
+        for depth in depths:
+            row = bench(args, latency, depth)
+            if base is None:
+                base = row['wall']
+            row['speedup'] = base / row['wall'] if row['wall'] > 0 else 0
+            results.append(row)
+            sys.stderr.write('%12g %8d %8d %10.3f %12.0f %9.1fx\n' % (latency, depth, row['files'], row['wall'], row['files_per_sec'], row['speedup']))
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump({'dir': args.DIR, 'args': args.args, 'python': sys.version.split()[0], 'results': results}, f, indent=2)
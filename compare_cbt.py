@@ -0,0 +1,145 @@
+#!/usr/bin/python
+#
+# Compare sets of CBT archives (e.g. before and after a Ceph upgrade or tuning change) and
+# flag performance regressions against the first (baseline) set
+#
+#   ./compare_cbt.py -a="--hist" '/archives/before-*' '/archives/after-*'
+#
+# Each SET is a comma-separated list of archive dirs or glob patterns. Tests are joined on
+# (benchmark, mode, rwmixread, clients, op_size, iodepth) and averaged over all iterations and
+# archives of a set; the iteration variance decides whether a change is significant.
+
+import sys
+import glob
+import argparse
+import multiprocessing
+import numpy as np
+import parse_new_cbt
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Compare CBT archive sets and flag regressions.')
+    parser.add_argument('-p', '--pctiles', dest='pctiles', action='store', default='50.00,99.00', required=False, help='Comma-seperated latency percentiles to compare (default: 50.00,99.00).')
+    parser.add_argument('-i', '--iops-threshold', dest='iops_threshold', action='store', type=float, default=5.0, required=False, help='Flag IOPS and bandwidth drops larger than this percentage (default: 5).')
+    parser.add_argument('-l', '--lat-threshold', dest='lat_threshold', action='store', type=float, default=10.0, required=False, help='Flag latency increases larger than this percentage (default: 10).')
+    parser.add_argument('--sigma', dest='sigma', action='store', type=float, default=2.0, required=False, help='When both sets have several iterations, also require the change to exceed this many standard errors (default: 2).')
+    parser.add_argument('-e', '--exit-code', dest='exit_code', action='store_true', default=False, required=False, help='Exit with status 1 when a regression is found.')
+    parser.add_argument('-a', '--args', dest='args', default='', help='Extra parse_new_cbt.py options, e.g. -a="--hist --cache".')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int, default=1, required=False, help='Parse test directories with N worker processes (0 = one per CPU).')
+    parser.add_argument('SETS', help='Archive sets; the first one is the baseline', nargs='+')
+    args = parser.parse_args()
+    if len(args.SETS) < 2:
+        parser.error('at least two archive sets are needed')
+    return args
+
+def expand_set(spec):
+    dirs = []
+    for pattern in spec.split(','):
+        dirs.extend(sorted(glob.glob(pattern)) or [pattern])
+    return dirs
+
+# Compared metrics as (name, is a latency) and their values for one Test
+def metric_names(buckets):
+    return [('IOPS', False), ('Bandwidth(KB/s)', False), ('avgLat(ms)', True)] + [('%spctLat(ms)' % bucket, True) for bucket in buckets] + [('maxLat(ms)', True)]
+
+def test_metrics(test, buckets):
+    pct = test.pctiles['all'] if test.pctiles else test.lat
+    return [test.iops, test.bw, test.lat['avg']] + [pct.get(float(bucket), np.nan) for bucket in buckets] + [test.lat['max']]
+
+# Mean, variance (ddof=1) and count per (join key, set) for every metric, from bincounts over
+# group ids so the join stays linear in the number of tests
+def group_stats(group, values, groups):
+    valid = ~np.isnan(values)
+    filled = np.where(valid, values, 0)
+    shape = (values.shape[1], groups)
+    count = np.array([np.bincount(group, weights=valid[:, m], minlength=groups) for m in range(values.shape[1])]).reshape(shape)
+    total = np.array([np.bincount(group, weights=filled[:, m], minlength=groups) for m in range(values.shape[1])]).reshape(shape)
+    squares = np.array([np.bincount(group, weights=filled[:, m] ** 2, minlength=groups) for m in range(values.shape[1])]).reshape(shape)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        mean = total / count
+        var = np.where(count > 1, (squares - count * mean ** 2) / (count - 1), np.nan)
+    return mean, np.maximum(var, 0), count
+
+def compare(ctx, sets, tests):
+    buckets = ctx.pctiles.split(',') if ctx.pctiles else []
+    metrics = metric_names(buckets)
+    keys = {}
+    group = []
+    values = []
+    for set_id, set_tests in enumerate(tests):
+        for test in set_tests:
+            key = parse_new_cbt.config_key(test)
+            key_id = keys.setdefault(key, len(keys))
+            group.append(key_id * len(sets) + set_id)
+            values.append(test_metrics(test, buckets))
+    if not keys:
+        return metrics, [], 0, 0
+    values = np.array(values, dtype=np.float64)
+    mean, var, count = group_stats(np.array(group), values, len(keys) * len(sets))
+    # (metric, key, set)
+    mean = mean.reshape(len(metrics), len(keys), len(sets))
+    var = var.reshape(mean.shape)
+    count = count.reshape(mean.shape)
+
+    base = mean[:, :, :1]
+    with np.errstate(divide='ignore', invalid='ignore'):
+        delta = (mean - base) / base * 100
+        stderr = np.sqrt(var / count + var[:, :, :1] / count[:, :, :1])
+    latency = np.array([is_lat for name, is_lat in metrics])[:, None, None]
+    worse = np.where(latency, delta > ctx.lat_threshold, delta < -ctx.iops_threshold)
+    # A change within the iteration noise is not a regression; single runs only use the threshold
+    significant = np.where(np.isnan(stderr), True, np.abs(mean - base) > ctx.sigma * stderr)
+    regressed = worse & significant
+
+    present = count.max(axis=0) > 0
+    rows = []
+    regressions = 0
+    for key, key_id in sorted(keys.items(), key=lambda item: parse_new_cbt.sort_key(item[0])):
+        if not present[key_id, 0]:
+            continue
+        for set_id in range(1, len(sets)):
+            if not present[key_id, set_id]:
+                continue
+            flagged = [metrics[m][0] for m in range(len(metrics)) if regressed[m, key_id, set_id]]
+            regressions += bool(flagged)
+            rows.append((key, sets[set_id], [(mean[m, key_id, 0], mean[m, key_id, set_id], delta[m, key_id, set_id]) for m in range(len(metrics))], flagged))
+    unmatched = int((~present.all(axis=1)).sum())
+    return metrics, rows, regressions, unmatched
+
+def print_rows(metrics, rows):
+    sys.stdout.write('Benchmark, Pattern, Mix, Procs, IOSize, IODepth, Set')
+    for name, is_lat in metrics:
+        sys.stdout.write(', base%s, new%s, delta%s(%%)' % (name, name, name.split('(')[0]))
+    print(', Regressions')
+    for key, name, cells, flagged in rows:
+        sys.stdout.write('%s, %s, %s, %s, %s, %s, %s' % (key + (name,)))
+        for base, new, delta in cells:
+            sys.stdout.write(', %.2f, %.2f, %.2f' % (base, new, delta))
+        print(', %s' % ';'.join(flagged))
+
+if __name__ == '__main__':
+    args = parse_args()
+    sets = [expand_set(spec) for spec in args.SETS]
+    ctx = parse_new_cbt.parse_args([sets[0][0], '-p', args.pctiles] + args.args.split())
+
+    cache = parse_new_cbt.ResultCache(ctx.cache) if ctx.cache else None
+    index = parse_new_cbt.ArchiveIndex()
+    pool = None
+    workers = args.jobs or multiprocessing.cpu_count()
+    if workers != 1:
+        pool = multiprocessing.Pool(workers)
+
+    tests = []
+    for dirs in sets:
+        tests.append([test for dn in dirs for test in parse_new_cbt.load_archive(ctx, dn, index, cache, pool, workers) if test.clients])
+
+    if pool:
+        pool.close()
+        pool.join()
+    if cache:
+        cache.close()
+
+    metrics, rows, regressions, unmatched = compare(args, args.SETS, tests)
+    print_rows(metrics, rows)
+    sys.stderr.write('%d comparisons, %d with regressions, %d configurations not in every set\n' % (len(rows), regressions, unmatched))
+    if args.exit_code and regressions:
+        sys.exit(1)
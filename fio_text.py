@@ -0,0 +1,95 @@
+#
+# Single-pass tokenizer for fio "normal" (text) output, used by parse_cbt.py
+#
+# Each line is classified once by its leading token and only the matching
+# precompiled pattern is applied to it. Written to run under both Python 2
+# and Python 3.
+#
+# Orlando Moreno
+
+import re
+
+IOPS_LINE = re.compile(r'\s+(?P<block>read|write)\s*: IOPS=(?P<iops>\d+[\.\d]*k*), BW=(?P<biw>\d+[\.\d]*)(?P<biw_unit>\S+) \((?P<bw>\d+[\.\d]*)(?P<bw_unit>\S+)\)\((?P<io>\d+)(?P<io_unit>\S+)/(?P<runt>\d+)(?P<runt_unit>\S+)\)')
+LAT_LINE = re.compile(r'\s+lat \((?P<unit>\S+)\):\s+min=\s*(?P<min>\d+[\.\d]*), max=\s*(?P<max>\d+[\.\d]*k*), avg=\s*(?P<avg>\d+[\.\d]*), stdev=\s*(?P<stdev>\d+[\.\d]*)')
+PCT_UNIT_LINE = re.compile(r'\s+clat percentiles \((?P<unit>\S+)\):')
+PCT_LINE = re.compile(r'\s+\|\s+\d+[\.\d]*th=')
+PCT_CELL = re.compile(r'(\d+[\.\d]*)th=\[\s*(\d+[\.\d]*)\]')
+PID = re.compile(r'\spid=(\d+)')
+
+def convert_unit(unit):
+	if(unit == 'B/s' or unit == 'sec'):
+		return 1
+	elif(unit == 'KB/s' or unit == 'kB/s' or unit == 'msec'):
+		return 1000
+	elif(unit == 'MB/s' or unit == 'MB/sec' or unit == 'usec'):
+		return 1000000
+	elif(unit == 'GB/s' or unit == 'nsec'):
+		return 1000000000
+	else:
+		return 0;
+
+def new_iothread(pid):
+	iothread = {}
+	iothread['pid'] = pid
+	iothread.update(dict.fromkeys(['read_iops', 'read_bw', 'read_runt', 'read_avglat', 'read_minlat', 'read_maxlat','read_stdev'], 0))
+	iothread['read_pctiles'] = {}
+	iothread.update(dict.fromkeys(['write_iops', 'write_bw', 'write_runt', 'write_avglat', 'write_minlat', 'write_maxlat', 'write_stdev'], 0))
+	iothread['write_pctiles'] = {}
+	iothread['thread_pctiles'] = {}
+	return iothread
+
+# Parse the lines of a fio text output into one dict per IO thread (job) holding its read/write
+# IOPS, bandwidth (KB/s), runtime and latencies (ms), and clat percentiles keyed by bucket string
+def parse_iothreads(lines):
+	iothreads = []
+	block = 'read'
+	pct_mult = convert_unit('msec')
+
+	for line in lines:
+		# Job header: "<name>: (groupid=0, jobs=1): err= 0: pid=N: ..."
+		if 'pid=' in line:
+			m = PID.search(line)
+			if m:
+				iothreads.append(new_iothread(m.group(1)))
+			continue
+		# Every other line of interest is indented
+		if not line[:1].isspace():
+			continue
+
+		token = line.lstrip()[:5]
+		if token[:1] == '|':
+			if PCT_LINE.match(line):
+				pctiles = iothreads[-1][block + '_pctiles']
+				for bucket, value in PCT_CELL.findall(line):
+					pctiles[bucket] = float(value) / pct_mult * 1000
+		elif token == 'read:' or token == 'read ' or token == 'write':
+			m = IOPS_LINE.match(line)
+			if m:
+				d = m.groupdict()
+				block = d['block']
+				iothread = iothreads[-1]
+				if 'k' in d['iops']:
+					iothread[block + '_iops'] = float(d['iops'].split('k')[0]) * 1000
+				else:
+					iothread[block + '_iops'] = int(d['iops'])
+				iothread[block + '_bw'] = float(d['bw']) * convert_unit(d['bw_unit']) / 1000
+				iothread[block + '_runt'] = float(d['runt']) / convert_unit(d['runt_unit']) * 1000
+		elif token == 'lat (':
+			m = LAT_LINE.match(line)
+			if m:
+				d = m.groupdict()
+				iothread = iothreads[-1]
+				mult = convert_unit(d['unit'])
+				iothread[block + '_minlat'] = float(d['min']) / mult * 1000
+				if 'k' in d['max']:
+					iothread[block + '_maxlat'] = float(d['max'].split('k')[0]) * 1000 / mult * 1000
+				else:
+					iothread[block + '_maxlat'] = float(d['max']) / mult * 1000
+				iothread[block + '_avglat'] = float(d['avg']) / mult * 1000
+				iothread[block + '_stdev'] = float(d['stdev']) / mult * 1000
+		elif token == 'clat ':
+			m = PCT_UNIT_LINE.match(line)
+			if m:
+				pct_mult = convert_unit(m.group('unit'))
+
+	return iothreads
@@ -0,0 +1,269 @@
+#!/usr/bin/python
+#
+# Generate a synthetic CBT archive for exercising and benchmarking the parsers
+#
+# Writes the benchmark_config.yaml/json_output.* layout read by parse_new_cbt.py
+# and/or the output.N.host fio text layout read by parse_cbt.py.
+#
+# Orlando Moreno
+
+import os
+import sys
+import json
+import math
+import argparse
+import hashlib
+import yaml
+import numpy as np
+
+# fio latency histogram layout (stat.h): 64 buckets per power of two
+FIO_IO_U_PLAT_BITS = 6
+FIO_IO_U_PLAT_VAL = 1 << FIO_IO_U_PLAT_BITS
+FIO_PCTILES = [1.0, 5.0, 10.0, 20.0, 30.0, 40.0, 50.0, 60.0, 70.0, 80.0, 90.0, 95.0, 99.0, 99.5, 99.9, 99.95, 99.99]
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Generate a synthetic CBT archive.')
+    parser.add_argument('-l', '--layout', dest='layout', choices=['new', 'legacy', 'both'], default='new', help='Archive layout to write (default: new).')
+    parser.add_argument('-b', '--benchmark', dest='benchmark', choices=['librbdfio', 'Radosbench'], default='librbdfio', help='Benchmark to simulate (default: librbdfio).')
+    parser.add_argument('-m', '--mixes', dest='mixes', default='0,70,100', help='Comma-seperated rwmixread values (default: 0,70,100).')
+    parser.add_argument('-d', '--iodepths', dest='iodepths', default='1,2,4,8,16,32', help='Comma-seperated iodepths (default: 1,2,4,8,16,32).')
+    parser.add_argument('-o', '--op-sizes', dest='op_sizes', default='4096', help='Comma-seperated op sizes in bytes (default: 4096).')
+    parser.add_argument('-i', '--iterations', dest='iterations', type=int, default=1, help='Iterations per test point (default: 1).')
+    parser.add_argument('-n', '--clients', dest='clients', type=int, default=5, help='Number of clients (default: 5).')
+    parser.add_argument('-v', '--volumes', dest='volumes', type=int, default=10, help='Volumes per client (default: 10).')
+    parser.add_argument('-j', '--jobs', dest='jobs', type=int, default=1, help='fio jobs per volume (default: 1).')
+    parser.add_argument('-s', '--samples', dest='samples', type=int, default=2000, help='Latency samples drawn per job, controls bin density (default: 2000).')
+    parser.add_argument('--no-bins', dest='bins', action='store_false', default=True, help='Omit clat_ns bins (plain json instead of json+).')
+    parser.add_argument('--logs', dest='logs', type=int, default=0, help='Write fio iops/bw/lat logs with this many 250ms samples per volume (default: 0).')
+    parser.add_argument('--seed', dest='seed', type=int, default=0, help='Random seed (default: 0).')
+    parser.add_argument('DIR', help='Output directory to create the archive(s) in')
+    args = parser.parse_args()
+    return args
+
+# Vectorized fio plat_val_to_idx()/plat_idx_to_val() (stat.c)
+def plat_val_to_idx(vals):
+    msb = np.frexp(vals.astype(np.float64))[1] - 1
+    error_bits = np.maximum(msb - FIO_IO_U_PLAT_BITS, 0)
+    idx = ((error_bits + 1) << FIO_IO_U_PLAT_BITS) + ((vals >> error_bits) & (FIO_IO_U_PLAT_VAL - 1))
+    return np.where(msb <= FIO_IO_U_PLAT_BITS, vals, idx)
+
+def plat_idx_to_val(idx):
+    error_bits = np.maximum((idx >> FIO_IO_U_PLAT_BITS) - 1, 0)
+    vals = np.left_shift(1, error_bits + FIO_IO_U_PLAT_BITS) + ((idx % FIO_IO_U_PLAT_VAL) + 0.5) * np.left_shift(1, error_bits)
+    return np.where(idx < (FIO_IO_U_PLAT_VAL << 1), idx, vals.astype(np.int64))
+
+# json+ bins (bucket value -> count) and the percentiles fio reports from them
+def histogram(samples):
+    vals, counts = np.unique(plat_idx_to_val(plat_val_to_idx(samples)), return_counts=True)
+    cum = np.cumsum(counts)
+    picks = vals[np.searchsorted(cum, np.array(FIO_PCTILES) / 100.0 * cum[-1], side='left')]
+    pctiles = dict(('%f' % pct, int(val)) for pct, val in zip(FIO_PCTILES, picks))
+    return dict((str(k), int(v)) for k, v in zip(vals, counts)), pctiles
+
+# Latency model: service time grows with queue depth, with a lognormal tail
+def direction(rng, ctx, iodepth, op_size, share, samples):
+    empty_lat = {'min': 0, 'max': 0, 'mean': 0.0, 'stddev': 0.0}
+    if share == 0:
+        clat = dict(empty_lat)
+        clat['percentile'] = dict(('%f' % pct, 0) for pct in FIO_PCTILES)
+        return {'io_bytes': 0, 'bw': 0, 'iops': 0.0, 'runtime': 0, 'total_ios': 0,
+                'slat_ns': dict(empty_lat), 'clat_ns': clat, 'lat_ns': dict(empty_lat)}
+    base_ns = 400000 * (1 + 0.15 * iodepth) * rng.uniform(0.9, 1.1)
+    lat = rng.lognormal(math.log(base_ns), 0.35, samples).astype(np.int64) + 1000
+    mean = float(lat.mean())
+    stddev = float(lat.std())
+    iops = share * iodepth * 1e9 / mean
+    bins, pctiles = histogram(lat)
+    clat = {'min': int(lat.min()), 'max': int(lat.max()), 'mean': mean, 'stddev': stddev, 'percentile': pctiles}
+    if ctx.bins:
+        clat['bins'] = bins
+    return {'io_bytes': int(iops * 300 * op_size), 'bw': int(iops * op_size / 1024), 'iops': iops, 'runtime': 300000,
+            'total_ios': int(iops * 300),
+            'slat_ns': {'min': 1000, 'max': 5000, 'mean': 2000.0, 'stddev': 100.0},
+            'clat_ns': clat,
+            'lat_ns': {'min': int(lat.min()) + 1000, 'max': int(lat.max()) + 5000, 'mean': mean + 2000, 'stddev': stddev}}
+
+def fio_json(rng, ctx, client, vol, mix, iodepth, op_size):
+    jobs = []
+    for j in range(ctx.jobs):
+        job = {'jobname': 'librbdfio-%s-%d' % (client, vol), 'groupid': 0, 'error': 0}
+        job['read'] = direction(rng, ctx, iodepth, op_size, mix / 100.0, ctx.samples)
+        job['write'] = direction(rng, ctx, iodepth, op_size, (100 - mix) / 100.0, ctx.samples)
+        job['trim'] = direction(rng, ctx, iodepth, op_size, 0, 0)
+        busy = 5 + iodepth * rng.uniform(0.5, 1.5)
+        job['usr_cpu'] = busy * 0.4
+        job['sys_cpu'] = busy * 0.6
+        job['ctx'] = int((job['read']['total_ios'] + job['write']['total_ios']) * rng.uniform(1.0, 2.5))
+        job['majf'] = 0
+        job['minf'] = int(rng.integers(100, 2001))
+        job['iodepth_level'] = {'1': 0.0, '2': 0.0, '4': 0.0, '8': 0.0, '16': 0.0, '32': 100.0, '>=64': 0.0}
+        job['latency_ns'] = {'2': 0.0, '4': 0.0, '10': 0.0}
+        jobs.append(job)
+    disk_util = [{'name': 'rbd%d' % vol, 'read_ios': 0, 'write_ios': 0, 'read_merges': 0, 'write_merges': 0,
+                  'read_ticks': 0, 'write_ticks': 0, 'in_queue': 0, 'util': rng.uniform(50.0, 99.0)}]
+    return {'fio version': 'fio-3.1', 'timestamp': 1596100000, 'time': 'Thu Jul 30 10:00:00 2020',
+            'global options': {'rw': 'randrw', 'bs': str(op_size), 'iodepth': str(iodepth)},
+            'jobs': jobs, 'disk_util': disk_util}
+
+def fmt_k(val):
+    if val >= 10000:
+        return '%.1fk' % (val / 1000.0)
+    return '%d' % int(val)
+
+# fio 3.x "normal" text output for one volume, as read by parse_cbt.py
+def fio_text(data, client):
+    lines = ['%s: (g=0): rw=randrw, bs=(R) 4096B-4096B, (W) 4096B-4096B, (T) 4096B-4096B, ioengine=rbd, iodepth=%s'
+             % (client, data['global options']['iodepth']), 'fio-3.1', 'Starting %d process' % len(data['jobs']), '']
+    for n, job in enumerate(data['jobs']):
+        lines.append('%s: (groupid=0, jobs=1): err= 0: pid=%d: Thu Jul 30 10:00:00 2020' % (client, 1000 + n))
+        for block in ('read', 'write'):
+            d = job[block]
+            if d['iops'] == 0:
+                continue
+            lines.append('  %5s: IOPS=%s, BW=%dKiB/s (%dkB/s)(%dMiB/%dmsec)' % (block, fmt_k(d['iops']), d['bw'], d['bw'] * 1.024,
+                         d['io_bytes'] >> 20, d['runtime']))
+            for key, name in (('slat_ns', 'slat'), ('clat_ns', 'clat'), ('lat_ns', ' lat')):
+                lat = d[key]
+                lines.append('    %s (usec): min=%d, max=%d, avg=%.2f, stdev=%.2f' % (name, lat['min'] / 1000, lat['max'] / 1000,
+                             lat['mean'] / 1000.0, lat['stddev'] / 1000.0))
+            lines.append('    clat percentiles (usec):')
+            cells = ['%5.2fth=[%5d]' % (float(k), v / 1000) for k, v in sorted(d['clat_ns']['percentile'].items(), key=lambda x: float(x[0]))]
+            for i in range(0, len(cells), 4):
+                lines.append('     | ' + ', '.join(cells[i:i + 4]) + (',' if i + 4 < len(cells) else ''))
+            lines.append('   bw (  KiB/s): min= 1000, max= 9000, per=10.00%%, avg=%.2f, stdev=100.00, samples=600' % d['bw'])
+            lines.append('   iops        : min=  250, max= 2250, avg=%.2f, stdev=25.00, samples=600' % d['iops'])
+        lines.append('  lat (usec)   : 250=0.01%, 500=1.00%, 750=10.00%, 1000=50.00%')
+        lines.append('  cpu          : usr=%.2f%%, sys=%.2f%%, ctx=%d, majf=%d, minf=%d' % (job['usr_cpu'], job['sys_cpu'], job['ctx'],
+                     job['majf'], job['minf']))
+        lines.append('  IO depths    : 1=0.1%, 2=0.1%, 4=0.1%, 8=0.1%, 16=0.1%, 32=99.9%, >=64=0.0%')
+    lines.append('')
+    lines.append('Run status group 0 (all jobs):')
+    return '\n'.join(lines) + '\n'
+
+def rados_summary(rng, concurrent, op_size, seconds=60):
+    rows = []
+    finished = 0
+    total_lat = 0.0
+    for sec in range(seconds + 1):
+        cur_mb = 0 if sec == 0 or rng.random() < 0.02 else rng.uniform(60, 120)
+        cur_ops = int(cur_mb * 1048576 / op_size)
+        finished += cur_ops
+        last_lat = rng.uniform(0.2, 1.5) if cur_ops else 0
+        total_lat += last_lat * cur_ops
+        avg_lat = total_lat / finished if finished else 0
+        avg_mb = finished * op_size / 1048576.0 / sec if sec else 0
+        rows.append((sec, concurrent, finished + concurrent, finished, avg_mb, cur_mb, last_lat, avg_lat))
+    bw = finished * op_size / 1048576.0 / seconds
+    summary = {'Total time run': seconds, 'Total writes made': finished, 'Write size': op_size, 'Object size': op_size,
+               'Bandwidth (MB/sec)': bw, 'Stddev Bandwidth': 10.0, 'Max bandwidth (MB/sec)': 120, 'Min bandwidth (MB/sec)': 0,
+               'Average IOPS': int(finished / seconds), 'Stddev IOPS': 5, 'Max IOPS': 30, 'Min IOPS': 0,
+               'Average Latency(s)': total_lat / finished if finished else 0, 'Stddev Latency(s)': 0.1,
+               'Max latency(s)': 1.5, 'Min latency(s)': 0.2}
+    return summary, rows
+
+def rados_text(summary, rows):
+    lines = ['Maintaining %d concurrent writes of %d bytes to objects of size %d for up to 60 seconds or 0 objects'
+             % (rows[0][1], summary['Write size'], summary['Object size'])]
+    for i, row in enumerate(rows):
+        if i % 20 == 0:
+            lines.append('  sec Cur ops   started  finished  avg MB/s  cur MB/s last lat(s)  avg lat(s)')
+        sec, cur, started, finished, avg_mb, cur_mb, last_lat, avg_lat = row
+        lines.append('%5d %7d %9d %9d %9.4f %9.4f %11s %11.6f' % (sec, cur, started, finished, avg_mb, cur_mb,
+                     '%.6f' % last_lat if last_lat else '-', avg_lat))
+    for key in ('Total time run', 'Total writes made', 'Write size', 'Object size', 'Bandwidth (MB/sec)', 'Stddev Bandwidth',
+                'Max bandwidth (MB/sec)', 'Min bandwidth (MB/sec)', 'Average IOPS', 'Stddev IOPS', 'Max IOPS', 'Min IOPS',
+                'Average Latency(s)', 'Stddev Latency(s)', 'Max latency(s)', 'Min latency(s)'):
+        lines.append('%-23s %s' % (key + ':', summary[key]))
+    return '\n'.join(lines) + '\n'
+
+# fio --write_{iops,bw,lat}_log output averaged over log_avg_msec windows, one row per direction
+def fio_logs(rng, path, prefix, data, samples):
+    op_size = int(data['global options']['bs'])
+    for kind in ('iops', 'bw', 'lat'):
+        with open(os.path.join(path, '%s_%s.1.log.%s' % (prefix[0], kind, prefix[1])), 'w') as f:
+            for i in range(samples):
+                ramp = min(1.0, (i + 1) / (samples / 2.0))
+                for ddir, block in enumerate(('read', 'write')):
+                    iops = sum(job[block]['iops'] for job in data['jobs'])
+                    if iops == 0:
+                        continue
+                    if kind == 'lat':
+                        val = sum(job[block]['lat_ns']['mean'] for job in data['jobs']) / len(data['jobs']) * rng.uniform(0.8, 1.2)
+                    else:
+                        val = iops * ramp * rng.uniform(0.8, 1.2)
+                        if kind == 'bw':
+                            val = val * op_size / 1024
+                    f.write('%d, %d, %d, %d, 0\n' % ((i + 1) * 250 + int(rng.integers(0, 3)), val, ddir, op_size))
+
+def write_yaml(fn, data):
+    with open(fn, 'w') as f:
+        yaml.safe_dump(data, f, default_flow_style=False)
+
+def generate(ctx):
+    rng = np.random.default_rng(ctx.seed)
+    # Radosbench results are write-only, so there is a single mix
+    mixes = [int(m) for m in ctx.mixes.split(',')] if ctx.benchmark == 'librbdfio' else [0]
+    iodepths = [int(d) for d in ctx.iodepths.split(',')]
+    op_sizes = [int(o) for o in ctx.op_sizes.split(',')]
+    clients = ['client%d' % (c + 1) for c in range(ctx.clients)]
+    new_root = os.path.join(ctx.DIR, 'new', 'results')
+    legacy_root = os.path.join(ctx.DIR, 'legacy', 'results')
+    cbt_config = {'cluster': {'user': 'root', 'head': 'node1', 'clients': clients, 'iterations': ctx.iterations},
+                  'benchmarks': {ctx.benchmark: {'mode': ['randrw'], 'rwmixread': mixes, 'op_size': op_sizes,
+                                                 'iodepth': iodepths, 'volumes_per_client': [ctx.volumes]}}}
+    if ctx.layout in ('new', 'both'):
+        os.makedirs(new_root)
+        write_yaml(os.path.join(new_root, 'cbt_config.yaml'), cbt_config)
+    count = 0
+    for iteration in range(ctx.iterations):
+        for op_size in op_sizes:
+            for mix in mixes:
+                for iodepth in iodepths:
+                    config = {'benchmark': ctx.benchmark, 'iteration': iteration, 'mode': 'randrw', 'rwmixread': mix,
+                              'op_size': op_size, 'iodepth': iodepth, 'volumes_per_client': ctx.volumes, 'numjobs': ctx.jobs,
+                              'time': 300, 'ramp': 300, 'log_avg_msec': 250, 'pool_profile': '3rep',
+                              'concurrent_ops': iodepth, 'clients': clients}
+                    hashid = 'id-' + hashlib.md5(json.dumps(config, sort_keys=True).encode()).hexdigest()
+                    new_dir = os.path.join(new_root, '%08d' % iteration, hashid)
+                    if ctx.benchmark == 'librbdfio':
+                        legacy_dir = os.path.join(legacy_root, '%08d' % iteration, 'LibrbdFio', 'osd_ra-00004096',
+                                                  'op_size-%08d' % op_size, 'concurrent_procs-%03d' % ctx.volumes,
+                                                  'iodepth-%03d' % iodepth, 'randrw', 'readmix-%d' % mix)
+                    else:
+                        legacy_dir = os.path.join(legacy_root, '%08d' % iteration, 'Radosbench', 'osd_ra-00004096',
+                                                  'op_size-%08d' % op_size, 'concurrent_ops-%08d' % iodepth, 'write')
+                    if ctx.layout in ('new', 'both'):
+                        os.makedirs(new_dir)
+                        write_yaml(os.path.join(new_dir, 'benchmark_config.yaml'), {'cluster': config})
+                    if ctx.layout in ('legacy', 'both'):
+                        os.makedirs(legacy_dir)
+                    for client in clients:
+                        volumes = range(ctx.volumes) if ctx.benchmark == 'librbdfio' else range(1)
+                        for vol in volumes:
+                            if ctx.benchmark == 'librbdfio':
+                                data = fio_json(rng, ctx, client, vol, mix, iodepth, op_size)
+                                if ctx.layout in ('new', 'both'):
+                                    with open(os.path.join(new_dir, 'json_output.%d.%s' % (vol, client)), 'w') as f:
+                                        json.dump(data, f, indent=2)
+                                    if ctx.logs:
+                                        fio_logs(rng, new_dir, ('output.%d' % vol, client), data, ctx.logs)
+                                if ctx.layout in ('legacy', 'both'):
+                                    with open(os.path.join(legacy_dir, 'output.%d.%s' % (vol, client)), 'w') as f:
+                                        f.write(fio_text(data, client))
+                            else:
+                                summary, rows = rados_summary(rng, iodepth, op_size)
+                                if ctx.layout in ('new', 'both'):
+                                    with open(os.path.join(new_dir, 'json_output.%d.%s' % (vol, client)), 'w') as f:
+                                        json.dump(summary, f, indent=2)
+                                    with open(os.path.join(new_dir, 'output.%d.%s' % (vol, client)), 'w') as f:
+                                        f.write(rados_text(summary, rows))
+                                if ctx.layout in ('legacy', 'both'):
+                                    with open(os.path.join(legacy_dir, 'output.%d.%s' % (vol, client)), 'w') as f:
+                                        f.write(rados_text(summary, rows))
+                            count += 1
+    return count
+
+if __name__ == '__main__':
+    ctx = parse_args()
+    count = generate(ctx)
+    sys.stderr.write('Wrote %d outputs to %s\n' % (count, ctx.DIR))
@@ -0,0 +1,116 @@
+#!/usr/bin/python
+#
+# Queue-depth scaling analysis of CBT iodepth sweeps: for each (benchmark, mode, rwmixread,
+# op_size, clients) series, find the saturation knee, the most IOPS sustainable under a latency
+# SLO, and interpolate IOPS/latency at queue depths that were not tested
+#
+#   ./knee_cbt.py --slo-ms 10 --at 3,12,24 /archives/sweep
+#
+# Iterations of the same point are averaged. Interpolation is linear in log2(iodepth) between the
+# nearest tested depths, matching the power-of-two sweeps in cbt.yaml; depths outside the tested
+# range are left empty.
+
+import sys
+import argparse
+import numpy as np
+import parse_new_cbt
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Find the saturation knee and SLO-bound IOPS of CBT iodepth sweeps.')
+    parser.add_argument('--slo-ms', dest='slo_ms', action='store', type=float, default=10.0, required=False, help='Latency SLO in ms (default: 10).')
+    parser.add_argument('--slo-pct', dest='slo_pct', action='store', default='99.00', required=False, help='Latency the SLO applies to: a percentile (##.##) or avg (default: 99.00).')
+    parser.add_argument('-k', '--knee-ratio', dest='knee_ratio', action='store', type=float, default=1.0, required=False, help='The knee is the first depth where relative latency growth exceeds this multiple of relative IOPS growth (default: 1).')
+    parser.add_argument('--at', dest='at', action='store', default='', required=False, help='Comma-seperated untested iodepths to interpolate IOPS and latency at.')
+    parser.add_argument('-a', '--args', dest='args', default='', help='Extra parse_new_cbt.py options, e.g. -a="--hist --cache".')
+    parser.add_argument('DIR', help='CBT output directory(s) to analyze', nargs='+')
+    args = parser.parse_args()
+    return args
+
+SERIES_KEY = ('benchmark', 'mode', 'rwmixread', 'op_size', 'clients')
+
+def series_key(test):
+    return tuple(test.clients if name == 'clients' else test.metadata.get(name) for name in SERIES_KEY)
+
+def slo_latency(test, slo_pct):
+    if slo_pct == 'avg':
+        return test.lat['avg']
+    pct = test.pctiles['all'] if test.pctiles else test.lat
+    return pct.get(float(slo_pct), np.nan)
+
+# Per series: iodepths in ascending order and the IOPS and SLO latency averaged over iterations
+def build_series(tests, slo_pct):
+    points = {}
+    for test in tests:
+        if test.clients == 0 or test.metadata.get('iodepth') is None:
+            continue
+        point = points.setdefault(series_key(test), {}).setdefault(test.metadata['iodepth'], [])
+        point.append((test.iops, slo_latency(test, slo_pct)))
+    series = {}
+    for key, depths in points.items():
+        qd = np.array(sorted(depths), dtype=np.float64)
+        values = np.array([np.mean(depths[depth], axis=0) for depth in sorted(depths)])
+        series[key] = (qd, values[:, 0], values[:, 1])
+    return series
+
+# First depth where latency grows faster than IOPS: the relative latency increase from the previous
+# point divided by the relative IOPS increase exceeds ratio (or IOPS stop growing at all)
+def find_knee(qd, iops, lat, ratio):
+    if len(qd) < 2:
+        return None
+    with np.errstate(divide='ignore', invalid='ignore'):
+        lat_growth = np.diff(lat) / lat[:-1]
+        iops_growth = np.diff(iops) / iops[:-1]
+        saturated = (iops_growth <= 0) | (lat_growth > ratio * iops_growth)
+    hits = np.flatnonzero(saturated & (lat_growth > 0))
+    if len(hits) == 0:
+        return None
+    return hits[0] + 1
+
+# Highest IOPS whose latency meets the SLO, interpolated to where the latency crosses it
+def slo_iops(qd, iops, lat, slo):
+    ok = lat <= slo
+    if not ok.any():
+        return np.nan, np.nan
+    best = np.flatnonzero(ok)[np.argmax(iops[ok])]
+    if best + 1 < len(qd) and not ok[best + 1] and lat[best + 1] > lat[best]:
+        frac = (slo - lat[best]) / (lat[best + 1] - lat[best])
+        log_qd = np.log2(qd[best]) + frac * (np.log2(qd[best + 1]) - np.log2(qd[best]))
+        return 2 ** log_qd, iops[best] + frac * (iops[best + 1] - iops[best])
+    return qd[best], iops[best]
+
+def interpolate(qd, values, at):
+    return np.interp(np.log2(at), np.log2(qd), values, left=np.nan, right=np.nan)
+
+if __name__ == '__main__':
+    args = parse_args()
+    pctiles = [] if args.slo_pct == 'avg' else ['-p', args.slo_pct]
+    ctx = parse_new_cbt.parse_args([args.DIR[0]] + pctiles + args.args.split())
+    index = parse_new_cbt.ArchiveIndex()
+    cache = parse_new_cbt.ResultCache(ctx.cache) if ctx.cache else None
+    tests = []
+    for dn in args.DIR:
+        tests.extend(parse_new_cbt.load_archive(ctx, dn, index, cache))
+    if cache:
+        cache.close()
+
+    at = np.array([float(depth) for depth in args.at.split(',')]) if args.at else np.array([])
+    lat_name = 'avgLat' if args.slo_pct == 'avg' else '%spctLat' % args.slo_pct
+    sys.stdout.write('Benchmark, Pattern, Mix, IOSize, Procs, Points, KneeIODepth, KneeIOPS, Knee%s(ms), PeakIOPS, PeakIODepth, SLOIODepth, SLOIOPS' % lat_name)
+    for depth in at:
+        sys.stdout.write(', IOPS@%g, %s@%g(ms)' % (depth, lat_name, depth))
+    print('')
+    series = build_series(tests, args.slo_pct)
+    for key in sorted(series, key=parse_new_cbt.sort_key):
+        qd, iops, lat = series[key]
+        knee = find_knee(qd, iops, lat, args.knee_ratio)
+        peak = np.argmax(iops)
+        slo_qd, slo_max = slo_iops(qd, iops, lat, args.slo_ms)
+        sys.stdout.write('%s, %s, %s, %s, %s, %d' % (key + (len(qd),)))
+        if knee is None:
+            sys.stdout.write(', , , ')
+        else:
+            sys.stdout.write(', %g, %d, %.2f' % (qd[knee], iops[knee], lat[knee]))
+        sys.stdout.write(', %d, %g, %.2f, %.0f' % (iops[peak], qd[peak], slo_qd, slo_max))
+        for depth_iops, depth_lat in zip(interpolate(qd, iops, at), interpolate(qd, lat, at)):
+            sys.stdout.write(', %.0f, %.2f' % (depth_iops, depth_lat))
+        print('')
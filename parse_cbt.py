@@ -13,28 +13,21 @@ import math
 import argparse
 from operator import itemgetter
 import numpy as np
+from fio_text import convert_unit, parse_iothreads
+import tarball
+import spill
+from StringIO import StringIO
 
 def parse_args():
 	parser = argparse.ArgumentParser(description='Parse CBT output directory.')
 	parser.add_argument('-p', '--pctiles', dest='pctiles', action='store', nargs="?", const="50.00,80.00,90.00,95.00,99.00", required=False, help='Print the specified comma-seperated latency percentiles (##.##).')
 	parser.add_argument('-s', '--split', dest='split', action='store_true', default=False, required=False, help='Seperate IOPS and latency between reads and writes.')
 	parser.add_argument('-c', '--csv', dest='csv', action='store_true', default=False, required=False, help='Print output in CSV format.')
-	parser.add_argument("DIR", help="CBT output directory(s) to parse", nargs="+")
+	parser.add_argument('--memory-budget', dest='memory_budget', action='store', type=float, default=None, required=False, help='Summarize each test as soon as its directory is parsed and sort the printed rows with at most this many MB in memory, spilling sorted runs to temporary files.')
+	parser.add_argument("DIR", help="CBT output directory(s) or archive tarball(s) (.tar, .tar.gz, .tar.zst, ...) to parse", nargs="+")
 	args = parser.parse_args()
 	return args
 
-def convert_unit(unit):
-	if(unit == 'B/s' or unit == 'sec'):
-		return 1
-	elif(unit == 'KB/s' or unit == 'kB/s' or unit == 'msec'):
-		return 1000
-	elif(unit == 'MB/s' or unit == 'MB/sec' or unit == 'usec'):
-		return 1000000
-	elif(unit == 'GB/s' or unit == 'nsec'):
-		return 1000000000
-	else:
-		return 0;
-
 def get_percentile(values, p):
 	s = sorted(values)
 	k = (len(s) - 1) * p
@@ -44,54 +37,110 @@ def get_percentile(values, p):
 		return s[int(k)]
 	return (s[int(f)] * (c - k)) + (s[int(c)] * (k - f))
 
+OUTPUT_FILE = re.compile('output\.\d+\.\w+')
+ITERATION_DIR = re.compile('\d+')
+BENCHMARK_DIR = re.compile('LibrbdFio|Radosbench')
+OSD_RA_DIR = re.compile('osd_ra-\d+')
+IOSIZE_DIR = re.compile('op_size-\d+')
+PROCS_DIR = re.compile('concurrent_procs-\d+|concurrent_ops-\d+')
+IODEPTH_DIR = re.compile('iodepth-\d+')
+PATTERN_DIR = re.compile('randrw|rw|readwrite|write|seq')
+MIX_DIR = re.compile('readmix-\d+')
+
+# Test parameters encoded in the directory names of an output path
+def parse_test_path(path):
+	Iteration = Benchmark = OSD_RA = IOSize = Procs = IODepth = Pattern = Mix = ""
+	for subdir in path.split('/'):
+		if ITERATION_DIR.match(subdir):
+			Iteration = subdir
+		elif BENCHMARK_DIR.match(subdir):
+			Benchmark = subdir
+		elif OSD_RA_DIR.match(subdir):
+			OSD_RA = subdir.split('-')[1]
+		elif IOSIZE_DIR.match(subdir):
+			IOSize = subdir.split('-')[1]
+		elif PROCS_DIR.match(subdir):
+			Procs = subdir.split('-')[1]
+		elif IODEPTH_DIR.match(subdir):
+			IODepth = subdir.split('-')[1]
+		elif PATTERN_DIR.match(subdir):
+			Pattern = subdir
+		elif MIX_DIR.match(subdir):
+			Mix = subdir.split('-')[1]
+	return Iteration, Benchmark, OSD_RA, IOSize, Procs, IODepth, Pattern, Mix
+
 def display_results(testRuns):
 	for testRun in testRuns:
 		print "========================================="
 		testRun.print_testRun()
 
 
+# Order in which a TestRun prints its tests
+def test_order(test):
+	return (test.benchmark, test.mix, test.procs, test.iosize, test.iteration, test.iodepth)
+
 class TestRun(object):
 	def __init__(self, ctx, dn):
 		self.ctx = ctx
 		self.tests = []
-		self.index = -1
+		# Test of each output directory, keyed by path
+		self.index = {}
+		# --memory-budget: printed lines of finished tests instead of the tests
+		self.sorter = None
+		if ctx.memory_budget:
+			self.sorter = spill.SpillSorter(ctx.memory_budget * 1048576)
 		self.parse_testRun(dn)
 
 	def parse_testRun(self, dn):
+		if tarball.is_tarball(dn):
+			self.parse_tarball(dn)
+			return
 		for path, dirs, files in os.walk(dn):
 			for file in files:
-				if re.match('output\.\d+\.\w+', file):
-					if not any(Test.path == path for Test in self.tests):
-						self.index += 1
-						Iteration = Benchmark = OSD_RA = IOSize = Procs = IODepth = Pattern = Mix = ""
-						for subdir in path.split('/'):
-							if re.match('\d+', subdir):
-								Iteration = subdir
-							elif re.match('LibrbdFio|Radosbench', subdir):
-								Benchmark = subdir
-							elif re.match('osd_ra-\d+', subdir):
-								OSD_RA = subdir.split('-')[1]
-							elif re.match('op_size-\d+', subdir):
-								IOSize = subdir.split('-')[1]
-							elif re.match('concurrent_procs-\d+|concurrent_ops-\d+', subdir):
-								Procs = subdir.split('-')[1]
-							elif re.match('iodepth-\d+', subdir):
-								IODepth = subdir.split('-')[1]
-							elif re.match('randrw|rw|readwrite|write|seq', subdir):
-								Pattern = subdir
-							elif re.match('readmix-\d+', subdir):
-								Mix = subdir.split('-')[1]
-
-						self.add_test(path, Iteration, Benchmark, OSD_RA, IOSize, Procs, IODepth, Pattern, Mix)
-						#parse and add output
-						self.tests[self.index].add_output(os.path.join(path, file))
-					else:
-						#parse and add output
-						self.tests[self.index].add_output(os.path.join(path, file))
+				if OUTPUT_FILE.match(file):
+					# One Test per directory, found through the path index
+					test = self.index.get(path)
+					if test is None:
+						test = self.add_test(path, *parse_test_path(path))
+					#parse and add output
+					test.add_output(os.path.join(path, file))
+			# All outputs of a directory are listed together, so its test is complete
+			if self.sorter and path in self.index:
+				self.finish(self.index.pop(path))
+
+	# Same as parse_testRun over a tarball, streaming only the output files
+	def parse_tarball(self, dn):
+		paths = []
+		for dirname, name, member, data in tarball.iter_members(dn, OUTPUT_FILE.match):
+			path = os.path.join(dn, dirname)
+			test = self.index.get(path)
+			if test is None:
+				test = self.add_test(path, *parse_test_path(path))
+				paths.append(path)
+			test.add_output(os.path.join(path, name), data.decode().splitlines(True))
+		# A test's members can be anywhere in the tarball; tests are only complete at the end
+		if self.sorter:
+			for path in paths:
+				self.finish(self.index.pop(path))
+
+	# Print a complete test into the sorter and drop it with its outputs
+	def finish(self, test):
+		stdout = sys.stdout
+		sys.stdout = StringIO()
+		try:
+			test.print_test()
+			line = sys.stdout.getvalue()
+		finally:
+			sys.stdout = stdout
+		self.sorter.add(test_order(test), line)
 
 	def add_test(self, path, iteration, benchmark, osd_ra, iosize, procs, iodepth, pattern, mix):
 		test = Test(self.ctx, path, iteration, benchmark, osd_ra, iosize, procs, iodepth, pattern, mix)
-		self.tests.append(test)
+		# Streamed tests are only held in the index until they are complete
+		if not self.sorter:
+			self.tests.append(test)
+		self.index[path] = test
+		return test
 
 	def print_testRun(self):
 
@@ -122,6 +171,10 @@ class TestRun(object):
 				print "Benchmark | Iteration | Procs | IOSize   | Pattern | Mix | IODepth | Bandwidth(KB/s) | IOPS | AvgLat(ms) | MinLat(ms) | MaxLat(ms)"
 				print "----------+-----------+-------+----------+---------+-----+---------+-----------------+------+------------+------------+-----------"
 
+		if self.sorter:
+			for line in self.sorter:
+				sys.stdout.write(line)
+			return
 		for test in self.tests:
 			test.print_test()
 
@@ -149,8 +202,9 @@ class Test(object):
 		self.outputs = []
 		self.clients = 0
 
-	def add_output(self, fn):
-		output = Output(self.ctx, self.benchmark, fn)
+	# lines holds the file's contents when it comes from a tarball
+	def add_output(self, fn, lines=None):
+		output = Output(self.ctx, self.benchmark, fn, lines)
 		self.outputs.append(output)
 
 	def calculate_results(self):
@@ -182,6 +236,13 @@ class Test(object):
                                 if output.bw > 0:
                                         self.clients += 1
                                 self.bw += output.bw
+                                self.iops += output.iops
+                                self.avglat += output.iops * output.avglat
+                        if self.iops > 0:
+                                self.avglat /= self.iops
+                        if self.outputs:
+                                self.minlat = min([item.minlat for item in self.outputs])
+                                self.maxlat = max([item.maxlat for item in self.outputs])
 
 	
 	def print_test(self):
@@ -213,7 +274,7 @@ class Test(object):
 			
 
 class Output(object):
-	def __init__(self, ctx, benchmark, fn):
+	def __init__(self, ctx, benchmark, fn, lines=None):
 		self.ctx = ctx
 		self.benchmark = benchmark
 		self.iops = None
@@ -228,14 +289,18 @@ class Output(object):
 		if self.ctx.pctiles:
 			self.buckets = self.ctx.pctiles.split(',')
 		if self.benchmark == "LibrbdFio":
-			self.parseFIO(fn)
+			self.parseFIO(fn, lines)
 		elif self.benchmark == "Radosbench":
-			self.parseRB(fn)
+			self.parseRB(fn, lines)
 
-	def parseRB(self, fn):
+	def parseRB(self, fn, lines=None):
 		time = 0
+		self.iops = 0
+		self.bw = 0
+		self.avglat = 0
+		self.maxlat = 0
 			
-		f = open(fn, 'r')
+		f = lines if lines is not None else open(fn, 'r')
 		for line in f:
 			
 			m = re.match('Total time run:\s+(?P<time>\d+[\.\d]*)', line)
@@ -244,58 +309,27 @@ class Output(object):
 			m = re.match('Bandwidth \((?P<bw_unit>\S+)\):\s+(?P<bw>\d+[\.\d]*)', line)
 			if m:
 				self.bw = float(m.groupdict()['bw']) * convert_unit(m.groupdict()['bw_unit']) / 1000
-
-	def parseFIO(self, fn):
-		iothreads = []
-		curthread = -1
-		block = 'read'
-		pct_unit = 'msec'
-
-		f = open(fn, 'r')
-		for line in f:
-			if re.search('pid=\d+', line):
-				curthread += 1
-				iothread = {}
-				iothread['pid'] = re.search('\spid=\d+', line).group(0).split('=')[1]
-				iothread.update(dict.fromkeys(['read_iops', 'read_bw', 'read_runt', 'read_avglat', 'read_minlat', 'read_maxlat','read_stdev'], 0))
-				iothread['read_pctiles'] = {}
-				iothread.update(dict.fromkeys(['write_iops', 'write_bw', 'write_runt', 'write_avglat', 'write_minlat', 'write_maxlat', 'write_stdev'], 0))
-				iothread['write_pctiles'] = {}
-				iothread['thread_pctiles'] = {}
-				iothreads.append(iothread)
-
-			#m = re.match('\s+(?P<block>read|write)\s*: io=(?P<io>\d+)(?P<io_unit>\S+), bw=(?P<bw>\d+[\.\d]*)(?P<bw_unit>\S+), iops=(?P<iops>\d+), runt=(?P<runt>\d+)(?P<runt_unit>\S+)', line)
-			m = re.match('\s+(?P<block>read|write)\s*: IOPS=(?P<iops>\d+[\.\d]*k*), BW=(?P<biw>\d+[\.\d]*)(?P<biw_unit>\S+) \((?P<bw>\d+[\.\d]*)(?P<bw_unit>\S+)\)\((?P<io>\d+)(?P<io_unit>\S+)/(?P<runt>\d+)(?P<runt_unit>\S+)\)', line)
+			m = re.match('Average IOPS:\s+(?P<iops>\d+)', line)
 			if m:
-				block = m.groupdict()['block']
-				if "k" in m.groupdict()['iops']:
-					iothreads[curthread][block + '_iops'] = float(m.groupdict()['iops'].split('k')[0]) * 1000
-				else:
-					iothreads[curthread][block + '_iops'] = int(m.groupdict()['iops'])
-				iothreads[curthread][block + '_bw'] = float(m.groupdict()['bw']) * convert_unit(m.groupdict()['bw_unit']) / 1000
-				iothreads[curthread][block + '_runt'] = float(m.groupdict()['runt']) /  convert_unit(m.groupdict()['runt_unit']) * 1000
-
-			m = re.match('\s+lat \((?P<unit>\S+)\):\s+min=\s*(?P<min>\d+[\.\d]*), max=\s*(?P<max>\d+[\.\d]*k*), avg=\s*(?P<avg>\d+[\.\d]*), stdev=\s*(?P<stdev>\d+[\.\d]*)', line)
+				self.iops = int(m.groupdict()['iops'])
+			# Latencies are reported in seconds
+			m = re.match('(?P<kind>Average|Max|Min) [Ll]atency\(s\):\s+(?P<lat>\d+[\.\d]*)', line)
 			if m:
-				mult = convert_unit(m.groupdict()['unit'])
-				iothreads[curthread][block + '_minlat'] = float(m.groupdict()['min']) /  mult * 1000
-				if "k" in m.groupdict()['max']:
-					iothreads[curthread][block + '_maxlat'] = float(m.groupdict()['max'].split('k')[0]) * 1000 / mult * 1000
+				lat = float(m.groupdict()['lat']) * 1000
+				if m.groupdict()['kind'] == 'Average':
+					self.avglat = lat
+				elif m.groupdict()['kind'] == 'Max':
+					self.maxlat = lat
 				else:
-					iothreads[curthread][block + '_maxlat'] = float(m.groupdict()['max']) / mult * 1000
-				iothreads[curthread][block + '_avglat'] = float(m.groupdict()['avg']) / mult * 1000
-				iothreads[curthread][block + '_stdev'] = float(m.groupdict()['stdev']) / mult * 1000
-			m = re.match('\s+clat percentiles \((?P<unit>\S+)\):', line)
-			if m:
-				pct_unit = m.groupdict()['unit']
-			m = re.match('\s+\|\s+\d+[\.\d]*th=', line)
-			if m:
-				for pct in line.split(','):
-					pctile = re.match('\s+[\|\s]*(?P<bucket>\d+[\.\d]*)th=\[\s*(?P<value>\d+[\.\d]*)\]', pct)
-					if pctile:
-						bucket = pctile.groupdict()['bucket']
-						value = float(pctile.groupdict()['value']) / convert_unit(pct_unit) * 1000
-						iothreads[curthread][block + '_pctiles'][bucket] = value
+					self.minlat = lat
+
+	def parseFIO(self, fn, lines=None):
+		if lines is not None:
+			iothreads = parse_iothreads(lines)
+		else:
+			f = open(fn, 'r')
+			iothreads = parse_iothreads(f)
+			f.close()
 
 		totaliops = 0
 		avglat = 0
@@ -351,6 +385,10 @@ if __name__ == '__main__':
 	ctx = parse_args()
 	testRuns = []
 	for dn in ctx.DIR:
+		if ctx.memory_budget:
+			# Print each archive as soon as it is parsed instead of keeping all of them
+			display_results([TestRun(ctx, dn)])
+			continue
 		testRuns.append(TestRun(ctx, dn))
 	
 	display_results(testRuns)
@@ -15,16 +15,63 @@ from operator import itemgetter
 import yaml
 import json
 import numpy as np
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor
 import sqlite3
+import io
+import hashlib
+import multiprocessing
+import time
+import resource
+import warnings
+from contextlib import redirect_stdout, contextmanager, nullcontext
+import tarball
+import spill
+try:
+    from yaml import CSafeLoader as YamlLoader
+except ImportError:
+    from yaml import SafeLoader as YamlLoader
 
-def parse_args():
+def parse_args(argv=None):
     parser = argparse.ArgumentParser(description='Parse CBT output directory.')
     parser.add_argument('-p', '--pctiles', dest='pctiles', action='store', nargs='?', const='50.00,80.00,90.00,95.00,99.00', required=False, help='Print the specified comma-seperated latency percentiles (##.##).')
     parser.add_argument('-s', '--split', dest='split', action='store_true', default=False, required=False, help='Seperate IOPS and latency between reads and writes.')
     parser.add_argument('-c', '--csv', dest='csv', action='store_true', default=True, required=False, help='Print output in CSV format.')
-    parser.add_argument('DIR', help='CBT output directory(s) to parse', nargs='+')
-    args = parser.parse_args()
+    parser.add_argument('-f', '--format', dest='format', action='store', choices=['csv', 'jsonl', 'npz', 'parquet'], default='csv', required=False, help='Output format (default: csv). npz and parquet are columnar and need --output.')
+    parser.add_argument('-o', '--output', dest='output', action='store', required=False, help='Write the summary to this file instead of stdout.')
+    parser.add_argument('--no-sort', dest='no_sort', action='store_true', default=False, required=False, help='Write each test as soon as it is summarized, in archive walk order, instead of sorting each archive first.')
+    parser.add_argument('--memory-budget', dest='memory_budget', action='store', type=float, default=None, required=False, help='Stream tests instead of keeping them: drop each test\'s per-output detail once summarized and sort with at most this many MB of rows and interned configs in memory (half each), spilling sorted runs to temporary files. npz/parquet output and tarballs are still held in memory.')
+    parser.add_argument('--stats', dest='stats', action='store_true', default=False, required=False, help='Print one row per test configuration across all iterations and archives with mean, stddev, min/max and a bootstrap confidence interval.')
+    parser.add_argument('--ci', dest='ci', action='store', type=float, default=95, required=False, help='Confidence level of the --stats intervals in percent (default: 95).')
+    parser.add_argument('--bootstrap', dest='bootstrap', action='store', type=int, default=2000, required=False, help='Bootstrap resamples per configuration for --stats (default: 2000).')
+    parser.add_argument('--prefetch', dest='prefetch', action='store', type=int, default=0, required=False, help='Read the configs and json outputs of up to N test directories ahead of the one being parsed, with N threads (for archives on NFS; default: 0 = off). Ignored with --jobs.')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int, default=1, required=False, help='Parse test directories with N worker processes (0 = one per CPU).')
+    parser.add_argument('--cache', dest='cache', action='store', nargs='?', const='/tmp/db.sqlite', required=False, help='Reuse results of unchanged tests from a SQLite cache (default: /tmp/db.sqlite).')
+    parser.add_argument('--lean-json', dest='lean_json', action='store_true', default=False, required=False, help='Decode only the fields used from each fio json output, skipping clat bins and other unused sections.')
+    parser.add_argument('--hist', dest='hist', action='store_true', default=False, required=False, help='Compute latency percentiles from the clat histograms (fio json+ bins) merged across jobs, volumes and clients.')
+    parser.add_argument('-t', '--timeline', dest='timeline', action='store_true', default=False, required=False, help='Load the fio iops/bw/lat logs (rados bench per-second output for Radosbench) into cluster-wide timelines and print steady-state throughput, jitter and stalls.')
+    parser.add_argument('--imbalance', dest='imbalance', action='store_true', default=False, required=False, help='Print the spread of IOPS and p99 latency across the volumes and clients of each test: Jain fairness indexes and the volumes and clients flagged as stragglers.')
+    parser.add_argument('--mad-z', dest='mad_z', action='store', type=float, default=3.5, required=False, help='--imbalance flags IOPS more than this many robust (MAD) standard deviations below the median (default: 3.5).')
+    parser.add_argument('--iqr-k', dest='iqr_k', action='store', type=float, default=1.5, required=False, help='--imbalance flags p99 latencies more than this many IQRs above the third quartile (default: 1.5).')
+    parser.add_argument('--cpu', dest='cpu', action='store_true', default=False, required=False, help='Print the fio client CPU usage, context switches, page faults and busiest device utilization of each test, with IOPS per CPU%% and CPU time and context switches per IO.')
+    parser.add_argument('--skip', dest='skip', action='store', type=float, default=0, required=False, help='Exclude the first SECONDS of each timeline from the steady state. fio already leaves ramp_time out of its logs (default: 0).')
+    parser.add_argument('--follow', dest='follow', action='store_true', default=False, required=False, help='Keep polling the archives and write each test as soon as its json outputs are complete.')
+    parser.add_argument('--interval', dest='interval', action='store', type=float, default=30, required=False, help='Seconds between --follow polls (default: 30).')
+    parser.add_argument('--idle', dest='idle', action='store', type=float, default=0, required=False, help='Stop --follow after this many seconds without a new or changing test. A test dir still missing json outputs is summarized anyway once unchanged this long (default: 0, never stop; summarize after 10 polls).')
+    parser.add_argument('-m', '--manifest', dest='manifest', action='store', required=False, help='Reuse and update an archive index in this JSON file; directories whose mtime is unchanged are not rescanned.')
+    parser.add_argument('--profile', dest='profile', action='store_true', default=False, required=False, help='Print per-phase wall/CPU time, the slowest files, bytes read and peak memory to stderr.')
+    parser.add_argument('--profile-json', dest='profile_json', action='store', required=False, help='Also write the --profile report to this JSON file (implies --profile).')
+    parser.add_argument('--profile-top', dest='profile_top', action='store', type=int, default=10, required=False, help='Number of slowest files listed by --profile (default: 10).')
+    parser.add_argument('DIR', help='CBT output directory(s) or archive tarball(s) (.tar, .tar.gz, .tar.zst, ...) to parse', nargs='+')
+    args = parser.parse_args(argv)
+    # A tarball is complete once written; there is nothing to follow
+    if args.follow and any(tarball.is_tarball(dn) for dn in args.DIR):
+        parser.error('--follow needs archive directories, not tarballs')
+    # --follow writes each test as it completes; --stats rows need every test first
+    if args.follow and args.stats:
+        parser.error('--follow cannot be combined with --stats')
+    if args.profile_json:
+        args.profile = True
     return args
 
 def convert_unit(unit):
@@ -39,36 +86,1192 @@ def convert_unit(unit):
     else:
         return 0;
 
-def print_header(ctx):
-    if ctx.pctiles:
-        if ctx.split:
-            sys.stdout.write('ArchiveDir, HashID, Benchmark, Iteration, Procs, IOSize, Pattern, Mix, IODepth, Bandwidth(KB/s), readIOPS, writeIOPS, readAvgLat(ms), writeAvgLat(ms), readMinLat(ms), writeMinLat(ms)')
-            for bucket in ctx.pctiles.split(','):
-                sys.stdout.write(', read%spctLat(ms), write%spctLat(ms)' % (bucket, bucket))
-            print(', readMaxLat(ms), writeMaxLat(ms)')
-        else:
-            sys.stdout.write('ArchiveDir, HashID, Benchmark, Iteration, Procs, IOSize, Pattern, Mix, IODepth, Bandwidth(KB/s), IOPS, avgLat(ms), minLat(ms)')
-            for bucket in ctx.pctiles.split(','):
-                sys.stdout.write(', %spctLat(ms)' % bucket)
-            print(', maxLat(ms)')
+# Summary columns for the given options as (field, CSV header, CSV format). Percentile cells a
+# test cannot answer are None and left out of the CSV row, as before.
+def output_columns(ctx):
+    buckets = ctx.pctiles.split(',') if ctx.pctiles else []
+    columns = [('archive_dir', 'ArchiveDir', '%s'), ('hashid', 'HashID', '%s'), ('benchmark', 'Benchmark', '%s'),
+        ('iteration', 'Iteration', '%s'), ('procs', 'Procs', '%s'), ('iosize', 'IOSize', '%s'), ('pattern', 'Pattern', '%s'),
+        ('mix', 'Mix', '%s'), ('iodepth', 'IODepth', '%s'), ('bandwidth', 'Bandwidth(KB/s)', '%d')]
+    if ctx.split:
+        columns += [('read_iops', 'readIOPS', '%d'), ('write_iops', 'writeIOPS', '%d'), ('read_avg_lat', 'readAvgLat(ms)', '%.2f'),
+            ('write_avg_lat', 'writeAvgLat(ms)', '%.2f'), ('read_min_lat', 'readMinLat(ms)', '%.2f'), ('write_min_lat', 'writeMinLat(ms)', '%.2f')]
+        for bucket in buckets:
+            field = bucket.replace('.', '_')
+            columns += [('read_p%s_lat' % field, 'read%spctLat(ms)' % bucket, '%.2f'), ('write_p%s_lat' % field, 'write%spctLat(ms)' % bucket, '%.2f')]
+        columns += [('read_max_lat', 'readMaxLat(ms)', '%.2f'), ('write_max_lat', 'writeMaxLat(ms)', '%.2f')]
     else:
-        if ctx.split:
-            sys.stdout.write('ArchiveDir, HashID, Benchmark, Iteration, Procs, IOSize, Pattern, Mix, IODepth, Bandwidth(KB/s), readIOPS, writeIOPS, readAvgLat(ms), writeAvgLat(ms), readMinLat(ms), writeMinLat(ms)')
-            print(', readMaxLat(ms), writeMaxLat(ms)')
+        columns += [('iops', 'IOPS', '%d'), ('avg_lat', 'avgLat(ms)', '%.2f'), ('min_lat', 'minLat(ms)', '%.2f')]
+        for bucket in buckets:
+            columns += [('p%s_lat' % bucket.replace('.', '_'), '%spctLat(ms)' % bucket, '%.2f')]
+        columns += [('max_lat', 'maxLat(ms)', '%.2f')]
+    if ctx.timeline:
+        columns += [('ss_iops', 'ssIOPS', '%d'), ('ss_iops_stdev', 'ssIOPSStdev', '%.2f'), ('ss_jitter', 'ssJitter(%)', '%.2f'),
+            ('ss_bandwidth', 'ssBandwidth(KB/s)', '%d'), ('ss_avg_lat', 'ssAvgLat(ms)', '%.2f'),
+            ('ss_stalls', 'Stalls', '%d'), ('ss_max_stall', 'MaxStall(ms)', '%d')]
+    if ctx.imbalance:
+        columns += [('iops_fairness', 'IOPSFairness', '%.3f'), ('client_fairness', 'ClientFairness', '%.3f'), ('iops_cv', 'VolIOPSCV(%)', '%.2f'),
+            ('p99_spread', 'Volp99Spread', '%.2f'), ('stragglers', 'Stragglers', '%d'), ('slow_clients', 'SlowClients', '%s'),
+            ('slow_volumes', 'SlowVolumes', '%s')]
+    if ctx.cpu:
+        columns += [('usr_cpu', 'usrCPU(%)', '%.2f'), ('sys_cpu', 'sysCPU(%)', '%.2f'), ('ctx_switches', 'CtxSwitches', '%d'),
+            ('major_faults', 'MajFaults', '%d'), ('minor_faults', 'MinFaults', '%d'), ('disk_util', 'DiskUtil(%)', '%.2f'),
+            ('iops_per_cpu', 'IOPSPerCPU%', '%.2f'), ('cpu_per_io', 'CPUPerIO(us)', '%.3f'), ('ctx_per_io', 'CtxPerIO', '%.3f')]
+    return columns
+
+# Output writers take rows from Test.row() as soon as they are final. Text writers go to a file or
+# stdout; rows are formatted and written as they arrive and batched by the stream's own buffer, which
+# on stdout keeps them in order with the warnings (empty outputs, ...) printed while parsing.
+class CsvWriter(object):
+    def __init__(self, stream, columns):
+        self.stream = stream
+        self.columns = columns
+        self.formats = [fmt for field, header, fmt in columns]
+        self.line = ', '.join(self.formats) + '\n'
+
+    def header(self):
+        self.stream.write(', '.join(header for field, header, fmt in self.columns) + '\n')
+
+    def write(self, row):
+        if None in row:
+            self.stream.write(', '.join(fmt % value for fmt, value in zip(self.formats, row) if value is not None or fmt == '%s') + '\n')
+        else:
+            self.stream.write(self.line % tuple(row))
+
+    def flush(self):
+        self.stream.flush()
+
+    def close(self):
+        self.flush()
+        if self.stream is not sys.stdout:
+            self.stream.close()
+
+# One JSON object per test, keyed by field name, with unrounded values. NaN and infinities (a
+# --stats stdev of one sample, ...) are not valid JSON and are written as null.
+class JsonLinesWriter(CsvWriter):
+    def header(self):
+        pass
+
+    def write(self, row):
+        row = [None if isinstance(value, (float, np.floating)) and not np.isfinite(value) else value for value in row]
+        self.stream.write(json.dumps(dict(zip((field for field, header, fmt in self.columns), row)), default=lambda value: value.item(), allow_nan=False) + '\n')
+
+# Sorts an archive's rows for --memory-budget: writer-compatible, rows are spilled to disk in
+# sorted runs and merged into the real writer on flush(), in the same order the main loop sorts
+# Tests. The sort fields are looked up in the row by column.
+SORT_FIELDS = ('benchmark', 'mix', 'procs', 'iosize', 'iteration', 'iodepth')
+
+class SortingWriter(object):
+    def __init__(self, writer, columns, budget):
+        self.writer = writer
+        fields = [field for field, header, fmt in columns]
+        self.key = [fields.index(field) for field in SORT_FIELDS]
+        self.sorter = spill.SpillSorter(budget)
+
+    def write(self, row):
+        self.sorter.add(tuple(row[i] for i in self.key), row)
+
+    def flush(self):
+        for row in self.sorter:
+            self.writer.write(row)
+        self.writer.flush()
+
+# Column-oriented binary output, written when the run ends: a NumPy .npz holding one array per
+# field, or a Parquet file through the pyarrow module make_writer() imported. Missing numbers are
+# NaN (null in Parquet).
+class ColumnarWriter(object):
+    def __init__(self, fn, columns, fmt, pyarrow=None):
+        self.fn = fn
+        self.fmt = fmt
+        self.pyarrow = pyarrow
+        self.fields = [field for field, header, fmt in columns]
+        self.data = dict((field, []) for field in self.fields)
+
+    def header(self):
+        pass
+
+    def write(self, row):
+        for field, value in zip(self.fields, row):
+            self.data[field].append(value)
+
+    def flush(self):
+        pass
+
+    def close(self):
+        if self.fmt == 'parquet':
+            self.pyarrow.parquet.write_table(self.pyarrow.table(self.data), self.fn)
+            return
+        arrays = {}
+        for field in self.fields:
+            values = self.data[field]
+            if all(isinstance(value, (int, float, np.number)) or value is None for value in values):
+                arrays[field] = np.array([np.nan if value is None else value for value in values])
+            else:
+                arrays[field] = np.array([str(value) for value in values])
+        np.savez(self.fn, **arrays)
+
+def make_writer(ctx, columns=None):
+    if columns is None:
+        columns = output_columns(ctx)
+    if ctx.format in ('npz', 'parquet'):
+        if not ctx.output:
+            sys.exit('--format %s needs an --output file' % ctx.format)
+        pyarrow = None
+        if ctx.format == 'parquet':
+            try:
+                import pyarrow.parquet
+            except ImportError:
+                sys.exit('--format parquet needs pyarrow; use --format npz instead')
+        return ColumnarWriter(ctx.output, columns, ctx.format, pyarrow)
+    stream = open(ctx.output, 'w') if ctx.output else sys.stdout
+    if ctx.format == 'jsonl':
+        return JsonLinesWriter(stream, columns)
+    return CsvWriter(stream, columns)
+
+# Keys of a fio json document that Output.parse_fio reads. Percentile keys ('99.000000') are kept
+# as well; everything else (iodepth levels, slat, device names, ...) is dropped while decoding.
+FIO_FIELDS = frozenset(['jobs', 'read', 'write', 'iops', 'bw', 'lat_ns', 'clat_ns', 'mean', 'min', 'max', 'percentile', 'bins',
+    'total_ios', 'runtime', 'job_runtime', 'usr_cpu', 'sys_cpu', 'ctx', 'majf', 'minf', 'disk_util', 'util'])
+
+# json+ clat/slat/lat "bins" objects are flat {"<ns>" : <count>} maps and make up most of the file
+FIO_BINS = re.compile(r',\s*"bins"\s*:\s*\{[^{}]*\}|"bins"\s*:\s*\{[^{}]*\}\s*,?')
+FIO_BINS_CAPTURE = re.compile(r'"bins"\s*:\s*(\{[^{}]*\})')
+
+# fio latency histogram layout (stat.h): FIO_IO_U_PLAT_GROUP_NR groups of 64 log-linear buckets
+FIO_IO_U_PLAT_BITS = 6
+FIO_IO_U_PLAT_VAL = 1 << FIO_IO_U_PLAT_BITS
+FIO_IO_U_PLAT_GROUP_NR = 29
+FIO_IO_U_PLAT_NR = FIO_IO_U_PLAT_GROUP_NR * FIO_IO_U_PLAT_VAL
+
+def prune_fio_object(pairs):
+    if not pairs:
+        return {}
+    key = pairs[0][0]
+    # Percentile maps are kept whole
+    if '.' in key:
+        return dict(pairs)
+    return dict((k, v) for k, v in pairs if k in FIO_FIELDS)
+
+# Text of a file, or of the given contents of one
+def read_text(fn, data=None):
+    if data is not None:
+        return data.decode()
+    with open(fn, 'r') as f:
+        return f.read()
+
+# Return a fio json output holding only FIO_FIELDS. The bins are cut out of the raw
+# text before decoding and every other object is pruned as soon as it is decoded, so the full
+# document tree is never built. With bins=True each clat_ns bins map is instead returned as an
+# (n, 2) array of (latency ns, count) rows, parsed straight from its text.
+def load_fio_json(fn, bins=False, data=None):
+    text = read_text(fn, data)
+    if not bins:
+        return json.loads(FIO_BINS.sub('', text), object_pairs_hook=prune_fio_object)
+    raw = []
+    def stash(m):
+        raw.append(m.group(1))
+        return '"bins" : %d' % (len(raw) - 1)
+    output = json.loads(FIO_BINS_CAPTURE.sub(stash, text), object_pairs_hook=prune_fio_object)
+    for job in output['jobs']:
+        for ddir in ('read', 'write'):
+            clat = job[ddir]['clat_ns']
+            if 'bins' in clat:
+                clat['bins'] = np.array(re.findall(r'\d+', raw[clat['bins']]), dtype=np.int64).reshape(-1, 2)
+    return output
+
+# Vectorized versions of fio's plat_val_to_idx()/plat_idx_to_val()
+def plat_val_to_idx(vals):
+    vals = np.asarray(vals, dtype=np.int64)
+    msb = np.frexp(vals.astype(np.float64))[1] - 1
+    error_bits = np.maximum(msb - FIO_IO_U_PLAT_BITS, 0)
+    idx = ((error_bits + 1) << FIO_IO_U_PLAT_BITS) + ((vals >> error_bits) & (FIO_IO_U_PLAT_VAL - 1))
+    idx = np.where(msb <= FIO_IO_U_PLAT_BITS, vals, idx)
+    return np.minimum(idx, FIO_IO_U_PLAT_NR - 1)
+
+def plat_idx_to_val(idx):
+    idx = np.asarray(idx, dtype=np.int64)
+    error_bits = np.maximum((idx >> FIO_IO_U_PLAT_BITS) - 1, 0)
+    base = np.left_shift(1, error_bits + FIO_IO_U_PLAT_BITS)
+    vals = base + ((idx % FIO_IO_U_PLAT_VAL) + 0.5) * np.left_shift(1, error_bits)
+    return np.where(idx < (FIO_IO_U_PLAT_VAL << 1), idx, vals.astype(np.int64))
+
+# Turn a json+ bins map (or (n, 2) array) into a dense FIO_IO_U_PLAT_NR bucket histogram
+def bins_to_hist(bins):
+    if isinstance(bins, dict):
+        bins = np.array([[int(k), v] for k, v in bins.items()], dtype=np.int64).reshape(-1, 2)
+    if len(bins) == 0:
+        return np.zeros(FIO_IO_U_PLAT_NR, dtype=np.int64)
+    return np.bincount(plat_val_to_idx(bins[:, 0]), weights=bins[:, 1], minlength=FIO_IO_U_PLAT_NR).astype(np.int64)
+
+# Percentiles (ms) of a bucket histogram, picked the way fio's calc_clat_percentiles() does
+def hist_percentiles(hist, pctiles):
+    cum = np.cumsum(hist)
+    if cum[-1] == 0:
+        return np.zeros(len(pctiles))
+    idx = np.searchsorted(cum, np.asarray(pctiles) / 100.0 * cum[-1], side='left')
+    return plat_idx_to_val(idx) / 1000000.0
+
+# fio --write_{iops,bw,lat}_log files as collected by CBT: output.<volume>_<kind>.<job>.log[.<host>]
+FIO_LOG = re.compile(r'^(?P<prefix>.+)_(?P<kind>iops|bw|lat)\.(?P<job>\d+)\.log(\.(?P<host>.+))?$')
+
+# (time ms, value, direction) rows of a fio log file or file object
+def read_log(source):
+    return np.loadtxt(source, delimiter=',', usecols=(0, 1, 2), ndmin=2)
+
+# rados bench stdout as collected by CBT: output.<volume>.<host>, next to json_output.<volume>.<host>
+RADOS_OUTPUT = re.compile(r'^output\.(?P<volume>\d+)\.(?P<host>.+)$')
+# One row of its per-second progress table:
+#   sec Cur ops started finished avg MB/s cur MB/s last lat(s) avg lat(s)
+# The header is repeated every 20 rows and last lat is '-' for seconds in which no op finished.
+RADOS_PROGRESS = re.compile(r'^ *(\d+) +(\d+) +(\d+) +(\d+) +(\S+) +(\S+) +(\S+) +(\S+) *$', re.M)
+
+# (sec, cur ops, started, finished, avg MB/s, cur MB/s, last lat, avg lat) rows of a rados bench
+# output, as text or bytes
+def read_rados_progress(text):
+    if isinstance(text, bytes):
+        text = text.decode()
+    rows = RADOS_PROGRESS.findall(text)
+    if not rows:
+        return np.zeros((0, 8))
+    cells = np.array(rows)
+    return np.where(cells == '-', 'nan', cells).astype(np.float64)
+
+# Cluster-aggregate timeline of a Test: the fio logs (or rados bench progress tables) of every
+# volume are binned onto a common log_avg_msec grid. iops and bw are summed per slot, latency is
+# IOPS-weighted.
+
+NO_STEADY_STATE = {'iops': 0, 'iops_stdev': 0, 'jitter': 0, 'bw': 0, 'lat': 0, 'stalls': 0, 'max_stall': 0}
+
+class Timeline(object):
+    def __init__(self, step):
+        self.step = step
+        self.iops = np.zeros(0)
+        self.bw = np.zeros(0)
+        self.lat_sum = np.zeros(0)
+        self.lat_weight = np.zeros(0)
+        # Number of volumes (rados bench clients) logging during each slot
+        self.samples = np.zeros(0)
+
+    def accumulate(self, total, slots, weights):
+        out = np.bincount(slots, weights=weights, minlength=max(len(total), slots.max() + 1 if len(slots) else 0))
+        out[:len(total)] += total
+        return out
+
+    # A volume is live in every slot from its first to its last log row. fio writes no row for a
+    # window without completions, so a slot it skipped in between is a stall, not a missing sample.
+    def cover(self, slots):
+        if len(slots):
+            span = np.arange(slots.min(), slots.max() + 1)
+            self.samples = self.accumulate(self.samples, span, np.ones(len(span)))
+
+    # fn is a log file name or a log already parsed by read_log()
+    def load_log(self, fn):
+        data = fn if isinstance(fn, np.ndarray) else read_log(fn)
+        slots = np.rint(data[:, 0] / self.step).astype(np.int64) - 1
+        return np.maximum(slots, 0), data[:, 1], data[:, 2].astype(np.int64)
+
+    # Add the iops/bw/lat logs of one volume (a dict of kind -> file name)
+    def add_volume(self, logs):
+        if 'iops' in logs:
+            iops_slots, iops, iops_ddir = self.load_log(logs['iops'])
+            self.iops = self.accumulate(self.iops, iops_slots, iops)
+            self.cover(iops_slots)
+        if 'bw' in logs:
+            slots, bw, ddir = self.load_log(logs['bw'])
+            self.bw = self.accumulate(self.bw, slots, bw)
+        if 'lat' in logs:
+            slots, lat, ddir = self.load_log(logs['lat'])
+            weight = np.ones(len(slots))
+            if 'iops' in logs:
+                # Weight each latency sample by the IOPS of the same slot and direction
+                keys = slots * 2 + ddir
+                per_key = np.bincount(iops_slots * 2 + iops_ddir, weights=iops, minlength=keys.max() + 1 if len(keys) else 0)
+                weight = per_key[keys]
+            self.lat_sum = self.accumulate(self.lat_sum, slots, lat * weight)
+            self.lat_weight = self.accumulate(self.lat_weight, slots, weight)
+
+    # Add one rados bench client from its progress table (read_rados_progress() rows). The table
+    # is cumulative: the ops finished in a second are the step in 'finished', and their latency
+    # sum is the step in finished * avg lat. Slots are whole seconds, so step must be 1000.
+    def add_rados(self, progress):
+        progress = progress[np.argsort(progress[:, 0], kind='stable')]
+        finished = progress[:, 3]
+        ops = np.diff(finished, prepend=0)
+        lat_sum = np.diff(finished * np.nan_to_num(progress[:, 7]), prepend=0)
+        # Second 0 is the start line, before any op could finish
+        live = progress[:, 0] >= 1
+        slots = progress[live, 0].astype(np.int64) - 1
+        self.iops = self.accumulate(self.iops, slots, ops[live])
+        self.cover(slots)
+        self.bw = self.accumulate(self.bw, slots, progress[live, 5] * 1000)
+        self.lat_sum = self.accumulate(self.lat_sum, slots, np.maximum(lat_sum[live], 0) * 1e9)
+        self.lat_weight = self.accumulate(self.lat_weight, slots, ops[live])
+
+    # Stalled slots (no IO completed anywhere in the cluster) among the kept ones, and the length
+    # of the longest run of consecutive stalled slots
+    def stalls(self, keep, iops):
+        stalled = np.zeros(len(keep), dtype=bool)
+        stalled[np.flatnonzero(keep)] = iops == 0
+        if not stalled.any():
+            return 0, 0
+        edges = np.diff(np.concatenate(([0], stalled.astype(np.int8), [0])))
+        longest = (np.flatnonzero(edges == -1) - np.flatnonzero(edges == 1)).max()
+        return int(stalled.sum()), int(longest)
+
+    def lat(self):
+        n = len(self.lat_weight)
+        return np.divide(self.lat_sum, self.lat_weight, out=np.zeros(n), where=self.lat_weight > 0)
+
+    # Steady-state summary, optionally skipping the first skip_ms of the run. Only slots during which
+    # every volume was logging are used, so ragged log ends do not drag the averages down; slots
+    # inside that span where nothing completed count as 0 IOPS.
+    def steady_state(self, skip_ms=0):
+        n = min(len(self.iops), len(self.bw) or len(self.iops), len(self.lat_weight) or len(self.iops))
+        first = int(skip_ms // self.step)
+        samples = self.samples[:n]
+        keep = np.zeros(n, dtype=bool)
+        if n > first:
+            keep[first:] = samples[first:] == samples[first:].max()
+        if not keep.any():
+            return dict(NO_STEADY_STATE)
+        iops = self.iops[:n][keep]
+        # Latency logging is often off; then there are only iops/bw logs
+        lat_weight = self.lat_weight[:n][keep].sum() if len(self.lat_weight) else 0
+        stalls, longest = self.stalls(keep, iops)
+        return {'iops': iops.mean(), 'iops_stdev': iops.std(),
+            'stalls': stalls, 'max_stall': longest * self.step,
+            'jitter': iops.std() / iops.mean() * 100 if iops.mean() else 0,
+            'bw': self.bw[:n][keep].mean() if len(self.bw) else 0,
+            'lat': self.lat_sum[:n][keep].sum() / lat_weight / 1000000 if lat_weight else 0}
+
+# Aggregation kernel shared by Output and Test. Metrics are packed into a (metrics x rows) matrix
+# so every weighted mean of a direction comes out of one multiply and one row-wise sum; each row
+# is reduced in the same order np.ma.average would use, so results are bit-for-bit identical.
+def weighted_mean(matrix, weights):
+    weights = np.asarray(weights, dtype=np.float64)
+    return (matrix * weights).sum(axis=1) / weights.sum()
+
+# Weighted mean of each key over a list of metric dicts. Keys missing from any dict are left out.
+def weighted_average(rows, weights, keys=None):
+    keys = list(rows[0].keys() if keys is None else keys)
+    if not keys:
+        return {}
+    matrix = np.array([[row.get(key, np.nan) for row in rows] for key in keys], dtype=np.float64)
+    valid = ~np.isnan(matrix).any(axis=1)
+    return dict(zip([key for key, ok in zip(keys, valid) if ok], weighted_mean(matrix[valid], weights)))
+
+# Robust outlier tests for --imbalance; NaNs are never flagged. Low IOPS use the modified z-score
+# (x - median) / (1.4826 * MAD), high latencies the upper Tukey fence Q3 + k * IQR, so a single
+# straggler cannot hide by inflating the spread the way it would inflate a stdev.
+def mad_low_outliers(values, z):
+    valid = ~np.isnan(values)
+    flagged = np.zeros(len(values), dtype=bool)
+    if valid.sum() < 3:
+        return flagged
+    median = np.median(values[valid])
+    mad = np.median(np.abs(values[valid] - median))
+    if mad > 0:
+        flagged[valid] = (values[valid] - median) / (1.4826 * mad) < -z
+    return flagged
+
+def iqr_high_outliers(values, k):
+    valid = ~np.isnan(values)
+    flagged = np.zeros(len(values), dtype=bool)
+    if valid.sum() < 3:
+        return flagged
+    q1, q3 = np.percentile(values[valid], [25, 75])
+    if q3 > q1:
+        flagged[valid] = values[valid] > q3 + k * (q3 - q1)
+    return flagged
+
+# Jain's fairness index: 1 when every member gets the same share, 1/n when one gets everything
+def jain_index(values):
+    squares = (values ** 2).sum()
+    return values.sum() ** 2 / (len(values) * squares) if squares > 0 else 0
+
+NO_IMBALANCE = {'fairness': 0, 'client_fairness': 0, 'iops_cv': 0, 'p99_spread': 0, 'stragglers': 0, 'slow_clients': '', 'slow_volumes': ''}
+
+# fio client counters summed over the jobs of an Output: usr/sys CPU in percent of one CPU, context
+# switches and page faults as counts over the run, CPU seconds and completed IOs
+CPU_COUNTERS = ('usr_cpu', 'sys_cpu', 'ctx', 'majf', 'minf', 'cpu_time', 'ios')
+
+NO_CPU = {'usr_cpu': 0, 'sys_cpu': 0, 'ctx': 0, 'majf': 0, 'minf': 0, 'cpu_time': 0, 'ios': 0, 'disk_util': 0,
+    'iops_per_cpu': 0, 'cpu_per_io': 0, 'ctx_per_io': 0}
+
+# json_output.<volume>.<host>
+JSON_OUTPUT_NAME = re.compile(r'^json_output\.(?P<volume>\d+)\.(?P<host>.+)$')
+
+# Interned metadata values: Tests with identical benchmark settings share one dict, and equal
+# nested values (client lists, pool profiles, ...) and strings are shared across all Tests
+METADATA = {}
+# Estimated bytes held by METADATA and CONFIGS: each entry costs about its key three times over
+# (the key, the interned value and dict overhead) plus INTERN_OVERHEAD
+INTERN_OVERHEAD = 200
+INTERN_BYTES = 0
+
+def intern_value(value):
+    global INTERN_BYTES
+    if isinstance(value, str):
+        return sys.intern(value)
+    if isinstance(value, (list, dict)):
+        key = json.dumps(value, sort_keys=True, default=str)
+        if key not in METADATA:
+            INTERN_BYTES += 3 * len(key) + INTERN_OVERHEAD
+            if isinstance(value, list):
+                METADATA[key] = [intern_value(item) for item in value]
+            else:
+                METADATA[key] = dict((intern_value(k), intern_value(v)) for k, v in value.items())
+        return METADATA[key]
+    return value
+
+# --memory-budget: interning only saves memory by sharing, so once the tables outgrow their share
+# of the budget they are dropped and start over. Tests built so far keep their values.
+def trim_interned(budget):
+    global INTERN_BYTES
+    if INTERN_BYTES > budget:
+        METADATA.clear()
+        CONFIGS.clear()
+        INTERN_BYTES = 0
+
+# Per-phase wall/CPU time, per-file parse latency, bytes read and peak RSS for --profile. Phases
+# interleave during the walk, so each one accumulates over all of its intervals. Only installed as
+# PROFILER when profiling; every call site goes through profile_phase()/PROFILER checks so a normal
+# run pays nothing beyond a None test.
+class Profiler(object):
+    def __init__(self):
+        self.phases = {}
+        self.order = []
+        self.files = []
+        self.bytes_read = 0
+
+    @contextmanager
+    def phase(self, name):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - wall, time.process_time() - cpu)
+
+    def add_phase(self, name, wall, cpu, calls=1):
+        if name not in self.phases:
+            self.phases[name] = [0.0, 0.0, 0]
+            self.order.append(name)
+        totals = self.phases[name]
+        totals[0] += wall
+        totals[1] += cpu
+        totals[2] += calls
+
+    # Time an archive walk itself, leaving out the work done on each directory it yields
+    def walk(self, walker):
+        walker = iter(walker)
+        while True:
+            with self.phase('walk'):
+                entry = next(walker, None)
+            if entry is None:
+                return
+            yield entry
+
+    def add_file(self, fn, seconds, size=None):
+        if size is None:
+            size = os.path.getsize(fn)
+        self.bytes_read += size
+        self.files.append((seconds, size, fn))
+
+    # Fold in the records of a worker process (--jobs)
+    def merge(self, other):
+        for name in other.order:
+            self.add_phase(name, *other.phases[name])
+        self.files.extend(other.files)
+        self.bytes_read += other.bytes_read
+
+    def report(self, top):
+        self_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+        child_rss = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss * 1024
+        latencies = np.array([item[0] for item in self.files])
+        return {'phases': [{'phase': name, 'wall': self.phases[name][0], 'cpu': self.phases[name][1], 'calls': self.phases[name][2]} for name in self.order],
+            'files': len(self.files),
+            'bytes_read': self.bytes_read,
+            'file_latency': {'mean': float(latencies.mean()) if len(latencies) else 0.0,
+                'p50': float(np.percentile(latencies, 50)) if len(latencies) else 0.0,
+                'p99': float(np.percentile(latencies, 99)) if len(latencies) else 0.0,
+                'max': float(latencies.max()) if len(latencies) else 0.0},
+            'slowest': [{'file': fn, 'seconds': seconds, 'bytes': size} for seconds, size, fn in sorted(self.files, reverse=True)[:top]],
+            'peak_rss': self_rss,
+            'peak_rss_workers': child_rss}
+
+    def print_report(self, report, stream=sys.stderr):
+        stream.write('%-12s %10s %10s %10s\n' % ('Phase', 'Wall(s)', 'CPU(s)', 'Calls'))
+        for row in report['phases']:
+            stream.write('%-12s %10.3f %10.3f %10d\n' % (row['phase'], row['wall'], row['cpu'], row['calls']))
+        latency = report['file_latency']
+        stream.write('Files parsed: %d, bytes read: %d (%.1f MB)\n' % (report['files'], report['bytes_read'], report['bytes_read'] / 1048576.0))
+        stream.write('Per-file parse latency (ms): mean %.3f, p50 %.3f, p99 %.3f, max %.3f\n' % (latency['mean'] * 1000,
+            latency['p50'] * 1000, latency['p99'] * 1000, latency['max'] * 1000))
+        stream.write('Peak RSS: %.1f MB (workers: %.1f MB)\n' % (report['peak_rss'] / 1048576.0, report['peak_rss_workers'] / 1048576.0))
+        if report['slowest']:
+            stream.write('Slowest files:\n')
+            for row in report['slowest']:
+                stream.write('%10.3f ms %10d B  %s\n' % (row['seconds'] * 1000, row['bytes'], row['file']))
+
+PROFILER = None
+
+def profile_phase(name):
+    if PROFILER:
+        return PROFILER.phase(name)
+    return nullcontext()
+
+# Parse a config file, or the given contents of one (a tarball member)
+def load_config(fn, data=None):
+    if PROFILER:
+        start = time.perf_counter()
+        with PROFILER.phase('yaml'):
+            config = load_config_file(fn, data)
+        PROFILER.add_file(fn, time.perf_counter() - start, None if data is None else len(data))
+        return config
+    return load_config_file(fn, data)
+
+# Parsed configs by content hash. The benchmark configs of a sweep differ in a handful of keys and
+# the same cbt_config.yaml is met in every archive, so each distinct file is parsed once, with the
+# libyaml loader when PyYAML has it, and interned so equal configs and values are shared.
+CONFIGS = {}
+
+def load_config_file(fn, data=None):
+    global INTERN_BYTES
+    if data is None:
+        with open(fn, 'rb') as stream:
+            data = stream.read()
+    digest = hashlib.sha1(data).digest()
+    if digest not in CONFIGS:
+        INTERN_BYTES += INTERN_OVERHEAD
+        CONFIGS[digest] = intern_value(yaml.load(data, Loader=YamlLoader))
+    return CONFIGS[digest]
+
+# Exact names of the files CBT writes into an archive
+CBT_CONFIG = 'cbt_config.yaml'
+BENCHMARK_CONFIG = 'benchmark_config.yaml'
+JSON_OUTPUT = 'json_output'
+
+# A test output dir as found by ArchiveIndex or scan_tarball(): its config stat, its json outputs
+# as (name, ctime, size, mtime_ns) in creation order, and the names of its fio logs. Test dirs read
+# from a tarball also hold the config and output contents, and their logs parsed into arrays;
+# --prefetch fills in the contents of the others.
+class TestDir(object):
+    __slots__ = ('path', 'hashid', 'config', 'outputs', 'logs', 'members')
+
+    def __init__(self, path, config, outputs, logs, members=None):
+        self.path = path
+        # The last path component starting with 'id'
+        self.hashid = None
+        for subdir in path.split('/'):
+            if re.match('id', subdir):
+                self.hashid = subdir
+        self.config = config
+        self.outputs = sorted(outputs, key=itemgetter(1))
+        self.logs = logs
+        self.members = members
+
+    # Contents of a member file, or None when it is to be read from disk
+    def data(self, name):
+        return self.members.get(name) if self.members else None
+
+# Whole contents of a file: one read() of the size it was stat'ed at, straight from the unbuffered
+# file, then whatever it has grown by since
+def read_file(fn, size=None):
+    with open(fn, 'rb', buffering=0) as f:
+        data = f.read(size) if size else f.readall()
+        rest = f.readall()
+    return data + rest if rest else data
+
+# Config and json output contents of a test dir, as TestDir.members
+def fetch_test_dir(test_dir):
+    members = {BENCHMARK_CONFIG: read_file(os.path.join(test_dir.path, BENCHMARK_CONFIG), test_dir.config[1])}
+    for name, ctime, size, mtime in test_dir.outputs:
+        if size > 0:
+            members[name] = read_file(os.path.join(test_dir.path, name), size)
+    return members
+
+# --prefetch: bounded read-ahead over an archive walk. Network filesystems spend most of a file
+# read waiting on round trips, so up to depth test dirs past the one being parsed are read by as
+# many threads while it is decoded; the walk itself runs at most depth dirs ahead. Test dirs for
+# which skip() is true (cache hits) and tarball dirs, which already hold their members, are not
+# read. A dir that fails to read is passed on as is and read again, and reported, by the parser.
+def prefetch(items, depth, skip=None):
+    with ThreadPoolExecutor(depth) as executor:
+        queue = deque()
+        for item in items:
+            future = None
+            if isinstance(item, TestDir) and item.members is None and not (skip and skip(item)):
+                future = executor.submit(fetch_test_dir, item)
+            queue.append((item, future))
+            if len(queue) > depth:
+                yield fetched(*queue.popleft())
+        while queue:
+            yield fetched(*queue.popleft())
+
+def fetched(item, future):
+    if future is not None:
+        try:
+            with profile_phase('prefetch'):
+                item.members = future.result()
+        except OSError:
+            pass
+    return item
+
+# Single-pass archive walk with os.scandir. Files are classified by exact name and only the json
+# outputs and benchmark config are stat'ed, once, with the DirEntry result reused for creation
+# order, empty-file checks and the cache fingerprint. Subdirectories of a test dir are not
+# descended. With a manifest, a directory whose mtime is unchanged reuses its recorded listing
+# and stats, and (with prune) a subtree that held no tests is skipped outright. Dir mtimes only
+# change when entries are added or removed, so a manifest is meant for archives whose tests have
+# finished.
+class ArchiveIndex(object):
+    def __init__(self, fn=None, prune=True):
+        self.fn = fn
+        self.prune = prune
+        self.previous = {}
+        if fn and os.path.exists(fn):
+            with open(fn, 'r') as f:
+                self.previous = json.load(f)
+        self.dirs = {}
+
+    # Yield ('cbt', path) for each CBT config and a TestDir for each test dir, in os.walk order
+    def scan(self, top):
+        mtime = os.stat(top).st_mtime_ns
+        entry = self.previous.get(top)
+        if entry is None or entry['mtime'] != mtime:
+            entry = self.scan_dir(top, mtime)
+        elif self.prune and not entry['tests'] and not entry['cbt']:
+            self.dirs[top] = entry
+            return
+        self.dirs[top] = entry
+        if entry['cbt']:
+            yield 'cbt', os.path.join(top, CBT_CONFIG)
+        if entry['test']:
+            test = entry['test']
+            yield TestDir(top, test['config'], [tuple(output) for output in test['outputs']], test['logs'])
+            return
+        tests = 0
+        for name in entry['dirs']:
+            path = os.path.join(top, name)
+            for item in self.scan(path):
+                yield item
+            tests += self.dirs[path]['tests']
+        entry['tests'] = tests
+
+    def scan_dir(self, path, mtime):
+        dirs = []
+        outputs = []
+        logs = []
+        cbt = False
+        config = None
+        with os.scandir(path) as it:
+            for entry in it:
+                name = entry.name
+                if entry.is_dir():
+                    if not entry.is_symlink():
+                        dirs.append(name)
+                elif name == CBT_CONFIG:
+                    cbt = True
+                elif name == BENCHMARK_CONFIG:
+                    st = entry.stat()
+                    config = (st.st_mtime_ns, st.st_size)
+                elif name.startswith(JSON_OUTPUT):
+                    st = entry.stat()
+                    outputs.append((name, st.st_ctime, st.st_size, st.st_mtime_ns))
+                elif FIO_LOG.match(name) or RADOS_OUTPUT.match(name):
+                    logs.append(name)
+        test = None
+        if config is not None:
+            test = {'config': config, 'outputs': outputs, 'logs': logs}
+            dirs = []
+        return {'mtime': mtime, 'dirs': dirs, 'cbt': cbt, 'test': test, 'tests': 1 if test else 0}
+
+    def save(self):
+        if not self.fn:
+            return
+        entries = dict(self.previous)
+        entries.update(self.dirs)
+        with open(self.fn, 'w') as f:
+            json.dump(entries, f)
+
+# Walk a CBT archive tarball in one sequential pass, like ArchiveIndex.scan(). Only the configs and
+# json outputs are read (and the fio logs or rados bench outputs with --timeline, parsed straight
+# into arrays); everything else is skipped in the stream. tar stores a directory's files together,
+# so a test dir's TestDir is yielded as soon as the stream moves past it and only one test dir is
+# held in memory at a time. Tarballs have no ctime; outputs are ordered by mtime.
+def scan_tarball(ctx, dn):
+    def wanted(name):
+        return (name == CBT_CONFIG or name == BENCHMARK_CONFIG or name.startswith(JSON_OUTPUT)
+            or (ctx.timeline and (FIO_LOG.match(name) or RADOS_OUTPUT.match(name)) is not None))
+
+    current = None
+    entry = None
+    done = set()
+    for dirname, name, member, data in tarball.iter_members(dn, wanted):
+        path = os.path.join(dn, dirname)
+        if current is not None and path != current and not path.startswith(current + os.sep):
+            if entry['config'] is not None:
+                yield TestDir(current, entry['config'], entry['outputs'], entry['logs'], entry['members'])
+            done.add(current)
+            current = entry = None
+        if name == CBT_CONFIG:
+            yield 'cbt', os.path.join(path, name), data
+            continue
+        if path in done:
+            # Appended after the stream left its test dir (tar -r); that TestDir is already out
+            sys.stderr.write('%s: %s is stored apart from the rest of its test dir, skipped\n' % (dn, os.path.join(dirname, name)))
+            continue
+        if current is None:
+            current = path
+            entry = {'config': None, 'outputs': [], 'logs': {}, 'members': {}}
+        elif path != current:
+            # Like the directory walk, subdirs of a test dir are not looked into
+            continue
+        mtime_ns = int(member.mtime) * 1000000000
+        if name == BENCHMARK_CONFIG:
+            entry['config'] = (mtime_ns, member.size)
+            entry['members'][name] = data
+        elif name.startswith(JSON_OUTPUT):
+            entry['outputs'].append((name, member.mtime, member.size, mtime_ns))
+            entry['members'][name] = data
+        elif FIO_LOG.match(name):
+            entry['logs'][name] = read_log(io.BytesIO(data))
+        else:
+            entry['logs'][name] = read_rados_progress(data)
+    if current is not None and entry['config'] is not None:
+        yield TestDir(current, entry['config'], entry['outputs'], entry['logs'], entry['members'])
+
+# Build a Test from a test output dir: parse every json output and summarize
+def load_test(ctx, dn, test_dir, benchConfig, hashid):
+    path = test_dir.path
+    test = Test(ctx, dn, benchConfig['cluster'], hashid, path)
+    # Json outputs of this test directory, oldest first
+    for name, ctime, size, mtime in test_dir.outputs:
+        json_file = os.path.join(path, name)
+        # Check if file contains any data
+        if size > 0:
+            # Add json data to test outputs
+            test.add_output(json_file, test_dir.data(name))
         else:
-            sys.stdout.write('ArchiveDir, HashID, Benchmark, Iteration, Procs, IOSize, Pattern, Mix, IODepth, Bandwidth(KB/s), IOPS, avgLat(ms), minLat(ms)')
-            print(', maxLat(ms)')
+            #Found corrupted/empty JSON file
+            print('%s is empty' % json_file)
+    # Calculate test statistics from outputs
+    with profile_phase('aggregate'):
+        test.calculate_results()
+    if ctx.timeline:
+        with profile_phase('timeline'):
+            test.load_timeline(path, test_dir.logs)
+    if ctx.memory_budget:
+        # Streaming: only the aggregates are needed from here on
+        test.outputs = []
+        test.timeline = None
+    return test
+
+# Whether a summarized Test in cached ({hashid: (fingerprint, Test)}, from the result cache or an
+# earlier serve_cbt.py pass) can stand for an unchanged test dir: it must also hold what the options
+# ask for. Per-output spreads are never cached, nor CPU counters by older versions; those tests
+# are parsed again.
+def reusable(ctx, cached, hashid, fp):
+    if fp is None or hashid not in cached or cached[hashid][0] != fp:
+        return False
+    test = cached[hashid][1]
+    if not test.clients:
+        return True
+    if ctx.imbalance and test.imbalance is None:
+        return False
+    # Radosbench outputs have no CPU counters to wait for
+    fio = test.metadata['benchmark'] == 'fio' or test.metadata['benchmark'] == 'librbdfio'
+    return not (ctx.cpu and fio and test.cpu is None)
+
+# Test dirs per worker pool task, and tasks queued per worker ahead of the one being collected
+POOL_BATCH = 8
+IN_FLIGHT = 2
+
+# Summarize every test dir of an archive, in walk order. Tests whose inputs are unchanged come
+# from the result cache; the rest are parsed here or, with a pool, by its workers as the walk finds
+# them, in batches of POOL_BATCH with at most IN_FLIGHT batches per worker outstanding. A writer, if
+# given, gets each row as soon as its test is summarized; with keep=False the Tests are then
+# dropped instead of returned.
+def load_archive(ctx, dn, index, cache=None, pool=None, workers=1, writer=None, keep=True):
+    # List of test objects in CBT archive folder
+    tests = []
+    # Test dirs for the next pool task, and the results of those handed to the pool, in walk order
+    batch = []
+    running = deque()
+    # Previously summarized tests and the fingerprint of each test dir parsed in this run
+    with profile_phase('cache'):
+        cached = cache.load(ctx, dn) if cache else {}
+    fingerprints = {}
+
+    # With --profile the workers' phases are summed across processes; 'workers' is the parent's wait
+    def collect():
+        with profile_phase('workers'):
+            results = running.popleft().get()
+        for test, messages, profile in results:
+            sys.stdout.write(messages)
+            emit(test)
+            if PROFILER:
+                PROFILER.merge(profile)
+
+    def emit(test):
+        if ctx.memory_budget:
+            trim_interned(ctx.memory_budget * 1048576 / 2)
+        if writer:
+            writer.write(test.row())
+        if cache and test.path in fingerprints:
+            with profile_phase('cache'):
+                cache.add(test, fingerprints[test.path])
+        if keep:
+            tests.append(test)
+
+    # Walk through given directory
+    scan = scan_tarball(ctx, dn) if tarball.is_tarball(dn) else index.scan(dn)
+    if PROFILER:
+        scan = PROFILER.walk(scan)
+    # Worker processes do their own reads in parallel; read-ahead only helps the serial parser
+    if ctx.prefetch > 0 and not pool:
+        def skip(test_dir):
+            if not cache or test_dir.hashid not in cached:
+                return False
+            return reusable(ctx, cached, test_dir.hashid, cache.fingerprint(test_dir))
+        scan = prefetch(scan, ctx.prefetch, skip)
+    for item in scan:
+        # The CBT config of the archive folder is not needed for the summaries
+        if isinstance(item, tuple):
+            continue
+
+        # Otherwise it's a test output dir
+        test_dir = item
+        path = test_dir.path
+        hashid = test_dir.hashid
+
+        # Reuse the cached summary if none of the test's inputs changed
+        if cache:
+            with profile_phase('cache'):
+                fp = cache.fingerprint(test_dir)
+            if reusable(ctx, cached, hashid, fp):
+                # Timelines are not cached, only the json summaries are skipped
+                if ctx.timeline:
+                    with profile_phase('timeline'):
+                        cached[hashid][1].load_timeline(path, test_dir.logs)
+                emit(cached.pop(hashid)[1])
+                continue
+            fingerprints[path] = fp
+
+        benchConfig = load_config(os.path.join(path, BENCHMARK_CONFIG), test_dir.data(BENCHMARK_CONFIG))
+
+        # Create new Test object with current benchmark metadata
+        if pool:
+            batch.append((ctx, dn, test_dir, benchConfig, hashid))
+            if len(batch) == POOL_BATCH:
+                running.append(pool.apply_async(load_tests_worker, (batch,)))
+                batch = []
+            # Write out what is done, and wait for the oldest task once enough are queued
+            while running and (running[0].ready() or len(running) >= IN_FLIGHT * workers):
+                collect()
+        else:
+            emit(load_test(ctx, dn, test_dir, benchConfig, hashid))
+
+    if batch:
+        running.append(pool.apply_async(load_tests_worker, (batch,)))
+    while running:
+        collect()
+
+    if cache:
+        with profile_phase('cache'):
+            cache.flush()
+    return tests
+
+# Tests of the same configuration, whatever their iteration or archive
+CONFIG_KEY = ('benchmark', 'mode', 'rwmixread', 'clients', 'op_size', 'iodepth')
+
+def config_key(test):
+    return tuple(test.clients if name == 'clients' else test.metadata.get(name) for name in CONFIG_KEY)
+
+# Order config keys numerically where they are numbers
+def sort_key(key):
+    return tuple((0, value, '') if isinstance(value, (int, float)) else (1, 0, str(value)) for value in key)
+
+# Metrics summarized by --stats as (field, name, unit, value of a Test)
+def stats_metrics(ctx):
+    buckets = [float(bucket) for bucket in ctx.pctiles.split(',')] if ctx.pctiles else []
+    def pct(test):
+        return test.pctiles['all'] if test.pctiles else test.lat
+    metrics = [('iops', 'IOPS', '', lambda test: test.iops), ('bandwidth', 'Bandwidth', '(KB/s)', lambda test: test.bw)]
+    if ctx.split:
+        metrics += [('read_iops', 'readIOPS', '', lambda test: test.read_iops), ('write_iops', 'writeIOPS', '', lambda test: test.write_iops),
+            ('read_avg_lat', 'readAvgLat', '(ms)', lambda test: test.read_lat['avg']), ('write_avg_lat', 'writeAvgLat', '(ms)', lambda test: test.write_lat['avg'])]
+    metrics += [('avg_lat', 'avgLat', '(ms)', lambda test: test.lat['avg'])]
+    for bucket in buckets:
+        metrics += [('p%s_lat' % ('%.2f' % bucket).replace('.', '_'), '%.2fpctLat' % bucket, '(ms)', lambda test, bucket=bucket: pct(test).get(bucket, np.nan))]
+    metrics += [('max_lat', 'maxLat', '(ms)', lambda test: test.lat['max'])]
+    if ctx.timeline:
+        metrics += [('ss_iops', 'ssIOPS', '', lambda test: test.steady['iops'] if test.steady else np.nan),
+            ('ss_jitter', 'ssJitter', '(%)', lambda test: test.steady['jitter'] if test.steady else np.nan)]
+    if ctx.imbalance:
+        metrics += [('iops_fairness', 'IOPSFairness', '', lambda test: test.imbalance['fairness'] if test.imbalance else np.nan)]
+    if ctx.cpu:
+        metrics += [('iops_per_cpu', 'IOPSPerCPU%', '', lambda test: test.cpu['iops_per_cpu'] if test.cpu else np.nan),
+            ('cpu_per_io', 'CPUPerIO', '(us)', lambda test: test.cpu['cpu_per_io'] if test.cpu else np.nan),
+            ('ctx_per_io', 'CtxPerIO', '', lambda test: test.cpu['ctx_per_io'] if test.cpu else np.nan)]
+    return metrics
+
+STATS = [('mean', 'Mean'), ('stdev', 'Stdev'), ('min', 'Min'), ('max', 'Max'), ('ci_low', 'CILow'), ('ci_high', 'CIHigh')]
+
+def stats_columns(ctx):
+    columns = [('benchmark', 'Benchmark', '%s'), ('pattern', 'Pattern', '%s'), ('mix', 'Mix', '%s'), ('procs', 'Procs', '%s'),
+        ('iosize', 'IOSize', '%s'), ('iodepth', 'IODepth', '%s'), ('samples', 'Samples', '%d')]
+    for field, name, unit, value in stats_metrics(ctx):
+        columns += [('%s_%s' % (field, stat), '%s%s%s' % (name, label, unit), '%.2f') for stat, label in STATS]
+    return columns
+
+# Mean, stddev (ddof=1), min, max and a percentile bootstrap confidence interval of the mean, for
+# every group and metric. values is (samples, metrics). Groups of the same size are stacked into a
+# (groups, size, metrics) array and resampled at their own length, in chunks of at most
+# BOOTSTRAP_CELLS drawn values, so memory grows with neither the number of groups nor the largest.
+BOOTSTRAP_CELLS = 1 << 22
+
+def group_stats(values, group, groups, resamples=2000, ci=95, seed=0):
+    counts = np.bincount(group, minlength=groups)
+    order = np.argsort(group, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    metrics = values.shape[1]
+    stats = dict((stat, np.full((groups, metrics), np.nan)) for stat, label in STATS)
+    rng = np.random.default_rng(seed)
+    tail = (100 - ci) / 2
+
+    # Metrics a group never reported stay NaN; numpy warns about those all-NaN slices
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore', RuntimeWarning)
+        for size in np.unique(counts[counts > 0]):
+            ids = np.flatnonzero(counts == size)
+            data = values[order[starts[ids][:, None] + np.arange(size)]]
+            stats['mean'][ids] = np.nanmean(data, axis=1)
+            if size > 1:
+                stats['stdev'][ids] = np.nanstd(data, axis=1, ddof=1)
+            stats['min'][ids] = np.nanmin(data, axis=1)
+            stats['max'][ids] = np.nanmax(data, axis=1)
+            chunk = max(1, BOOTSTRAP_CELLS // (resamples * size * metrics))
+            for first in range(0, len(ids), chunk):
+                block = data[first:first + chunk]
+                picks = rng.integers(0, size, (len(block), resamples, size))
+                means = np.nanmean(block[np.arange(len(block))[:, None, None], picks], axis=2)
+                low, high = np.nanpercentile(means, [tail, 100 - tail], axis=1)
+                stats['ci_low'][ids[first:first + chunk]] = low
+                stats['ci_high'][ids[first:first + chunk]] = high
+    return counts, stats
+
+# --stats: one row per configuration over all tests, in configuration order
+def stats_rows(ctx, tests):
+    metrics = stats_metrics(ctx)
+    tests = [test for test in tests if test.clients]
+    if not tests:
+        return []
+    keys = {}
+    group = np.array([keys.setdefault(config_key(test), len(keys)) for test in tests])
+    values = np.array([[value(test) for field, name, unit, value in metrics] for test in tests], dtype=np.float64)
+    counts, stats = group_stats(values, group, len(keys), ctx.bootstrap, ctx.ci)
+    rows = []
+    for key, key_id in sorted(keys.items(), key=lambda item: sort_key(item[0])):
+        row = list(key) + [counts[key_id]]
+        for m in range(len(metrics)):
+            row += [float(stats[stat][key_id, m]) for stat, label in STATS]
+        rows.append(row)
+    return rows
+
+# Json outputs a test dir will hold once it is done: one per client, volume and process for fio,
+# otherwise at least one. Read from the cluster section load_test() builds the Test from.
+def expected_outputs(benchConfig):
+    cluster = benchConfig['cluster']
+    if cluster.get('benchmark') in ('fio', 'librbdfio') and cluster.get('clients'):
+        return len(cluster['clients']) * (cluster.get('volumes_per_client') or 1) * (cluster.get('procs_per_volume') or 1)
+    return 1
+
+# Polls a test dir missing outputs must stay unchanged before --follow gives up on them, without --idle
+STALE_POLLS = 10
+
+# --follow: poll the archives and summarize each test dir once, when all of its json outputs are
+# present, non-empty and unchanged since the previous poll. A dir that stays short of outputs (a
+# failed client) is summarized with a warning once unchanged for the --idle window, so it is never
+# dropped where a one-shot parse would have reported it. Finished Tests are written and dropped,
+# and directories that did not change are not rescanned, so a long sweep runs in flat memory and
+# CPU. Test dirs still being written are rescanned every poll since their outputs can grow without
+# changing the directory mtime.
+def follow_archives(ctx, writer, cache):
+    # New tests appear deep below unchanged directories, so empty subtrees are not pruned
+    index = ArchiveIndex(prune=False)
+    done = set()
+    # Test dir -> (outputs at the last poll, seconds they have been unchanged)
+    pending = {}
+    window = ctx.idle or STALE_POLLS * ctx.interval
+    idle = 0
+    while True:
+        found = 0
+        changed = 0
+        for dn in ctx.DIR:
+            for test_dir in index.scan(dn):
+                if isinstance(test_dir, tuple) or test_dir.path in done:
+                    continue
+                benchConfig = load_config(os.path.join(test_dir.path, BENCHMARK_CONFIG))
+                outputs = test_dir.outputs
+                if test_dir.path not in pending or pending[test_dir.path][0] != outputs:
+                    pending[test_dir.path] = (outputs, 0)
+                    changed += 1
+                    continue
+                stable = pending[test_dir.path][1] + ctx.interval
+                expected = expected_outputs(benchConfig)
+                written = sum(1 for output in outputs if output[2] > 0)
+                if written < expected:
+                    if stable < window:
+                        pending[test_dir.path] = (outputs, stable)
+                        continue
+                    sys.stderr.write('%s: %d of %d json outputs written, unchanged for %gs; summarizing without the rest\n'
+                        % (test_dir.path, written, expected, stable))
+                del pending[test_dir.path]
+                done.add(test_dir.path)
+                test = load_test(ctx, dn, test_dir, benchConfig, test_dir.hashid)
+                if cache:
+                    cache.add(test, cache.fingerprint(test_dir))
+                writer.write(test.row())
+                found += 1
+        if cache:
+            cache.flush()
+        writer.flush()
+        index.previous = index.dirs
+        index.dirs = {}
+        for path in pending:
+            index.previous.pop(path, None)
+        idle = 0 if found or changed else idle + ctx.interval
+        if ctx.idle and idle >= ctx.idle:
+            return
+        time.sleep(ctx.interval)
+
+# Worker entry point for --jobs; messages are captured and replayed in walk order by the parent
+def load_test_worker(task):
+    global PROFILER
+    # Each task is profiled on its own and its records merged by the parent
+    if task[0].profile:
+        PROFILER = Profiler()
+    buf = io.StringIO()
+    with redirect_stdout(buf):
+        test = load_test(*task)
+    if task[0].memory_budget:
+        trim_interned(task[0].memory_budget * 1048576 / 2)
+    return test, buf.getvalue(), PROFILER
+
+def load_tests_worker(tasks):
+    return [load_test_worker(task) for task in tasks]
+
+# Per-Test aggregates persisted by the result cache
+AGGREGATES = ['clients', 'iops', 'bw', 'lat', 'read_iops', 'write_iops', 'read_bw', 'write_bw', 'read_lat', 'write_lat', 'read_hist', 'write_hist', 'cpu']
+
+# On-disk cache of summarized Tests, keyed by (HashID, archive dir) and invalidated by a
+# fingerprint of the path, mtime and size of the test's config and json outputs
+class ResultCache(object):
+    # Pending rows are written once there are this many
+    FLUSH_ROWS = 1000
+    FORMAT = ['hash', 'testname', 'fingerprint', 'benchmark', 'iteration', 'procs', 'iosize', 'pattern', 'mix', 'iodepth',
+        'bandwidth', 'iops', 'avglat', 'metadata', 'aggregates']
+    TYPES = {'hash': 'text', 'testname': 'text', 'fingerprint': 'text', 'benchmark': 'text', 'iteration': 'integer', 'procs': 'integer',
+         'iosize': 'integer', 'pattern': 'text', 'mix': 'integer', 'iodepth': 'integer', 'bandwidth': 'integer', 'iops': 'real', 'avglat': 'real',
+         'metadata': 'text', 'aggregates': 'text'}
+
+    def __init__(self, fn):
+        self.conn = sqlite3.connect(fn)
+        columns = [row[1] for row in self.conn.execute('PRAGMA table_info(results)')]
+        if columns and columns != self.FORMAT:
+            # Table left over from an older layout; it only holds derived data so start over
+            self.conn.execute('DROP TABLE results')
+        q = 'CREATE TABLE if not exists results ('
+        values = []
+        for key in self.FORMAT:
+            values.append('%s %s' % (key, self.TYPES[key]))
+        q += ', '.join(values)+', PRIMARY KEY (hash, testname))'
+        self.conn.execute(q)
+        self.conn.commit()
+        self.pending = []
+
+    # Cheap change detector: only stats the directory entries, never opens the outputs
+    @staticmethod
+    def fingerprint(test_dir):
+        files = [(BENCHMARK_CONFIG,) + tuple(test_dir.config)]
+        for name, ctime, size, mtime in test_dir.outputs:
+            if size == 0:
+                # Never cache a test with empty outputs so the warning keeps being reported
+                return None
+            files.append((name, mtime, size))
+        entries = ['%s:%d:%d' % (os.path.join(test_dir.path, name), mtime, size) for name, mtime, size in sorted(files)]
+        return hashlib.sha1('\n'.join(entries).encode()).hexdigest()
+
+    # Return {hashid: (fingerprint, Test)} for every cached test of an archive dir
+    def load(self, ctx, dn):
+        cached = {}
+        for hashid, fp, metadata, aggregates in self.conn.execute('SELECT hash, fingerprint, metadata, aggregates FROM results WHERE testname = ?', (dn,)):
+            test = Test(ctx, dn, json.loads(metadata), hashid)
+            for key, value in json.loads(aggregates).items():
+                if key.endswith('_hist'):
+                    # Histograms are stored sparse as nonzero bucket indexes and counts
+                    if value is not None:
+                        hist = np.zeros(FIO_IO_U_PLAT_NR, dtype=np.int64)
+                        hist[value['idx']] = value['cnt']
+                        value = hist
+                elif key.endswith('lat'):
+                    value = dict((k if k in ('avg', 'min', 'max') else float(k), v) for k, v in value.items())
+                setattr(test, key, value)
+            test.calculate_pctiles()
+            cached[hashid] = (fp, test)
+        return cached
+
+    def add(self, test, fp):
+        if fp is None or test.clients == 0:
+            return
+        aggregates = {}
+        for key in AGGREGATES:
+            if hasattr(test, key):
+                value = getattr(test, key)
+                if value is None:
+                    pass
+                elif key.endswith('_hist'):
+                    idx = np.flatnonzero(value)
+                    value = {'idx': idx.tolist(), 'cnt': value[idx].tolist()}
+                elif isinstance(value, dict):
+                    value = dict((str(k), float(v)) for k, v in value.items())
+                else:
+                    value = float(value) if isinstance(value, np.floating) else int(value)
+                aggregates[key] = value
+        self.pending.append((test.hashid, test.dn, fp, test.metadata['benchmark'], int(test.metadata['iteration']),
+            test.clients, int(test.metadata['op_size']), test.metadata['mode'], int(test.metadata['rwmixread']), int(test.metadata['iodepth']),
+            int(test.bw), float(test.iops), float(test.lat['avg']), json.dumps(test.metadata, default=str), json.dumps(aggregates)))
+        if len(self.pending) >= self.FLUSH_ROWS:
+            self.flush()
+
+    # Write all pending rows in a single transaction
+    def flush(self):
+        if self.pending:
+            with self.conn:
+                self.conn.executemany('INSERT OR REPLACE INTO results VALUES(%s)' % ', '.join(['?'] * len(self.FORMAT)), self.pending)
+            self.pending = []
+
+    def close(self):
+        self.flush()
+        self.conn.close()
 
 # Test class contains the list of output objects (FIO or RadosBench) and the summarized results of those outputs
 class Test(object):
-    def __init__(self, ctx, dn, metadata, hashid):
+    __slots__ = ('ctx', 'dn', 'path', 'metadata', 'hashid', 'outputs', 'clients', 'iops', 'bw', 'lat', 'read_lat', 'write_lat',
+        'read_iops', 'write_iops', 'read_bw', 'write_bw', 'read_hist', 'write_hist', 'pctiles', 'timeline', 'steady', 'imbalance', 'cpu')
+
+    def __init__(self, ctx, dn, metadata, hashid, path=None):
         self.ctx = ctx
         self.dn = dn
-        self.metadata = metadata
-        if re.match('write|randwrite', self.metadata['mode']):
-            self.metadata['rwmixread'] = 0
-        elif re.match('read|randread', self.metadata['mode']):
-            self.metadata['rwmixread'] = 100
+        self.path = path
+        # Interned metadata is shared between Tests, so it is never modified in place
+        if re.match('write|randwrite', metadata['mode']):
+            metadata = dict(metadata, rwmixread=0)
+        elif re.match('read|randread', metadata['mode']):
+            metadata = dict(metadata, rwmixread=100)
+        self.metadata = intern_value(metadata)
         self.hashid = hashid
         self.outputs = []
         self.clients = 0
@@ -82,9 +1285,25 @@ class Test(object):
             self.write_iops = 0
             self.read_bw = 0
             self.write_bw = 0
+        # Merged clat histograms and the percentiles (ms) derived from them with --hist
+        self.read_hist = None
+        self.write_hist = None
+        self.pctiles = None
+        self.timeline = None
+        self.steady = None
+        self.imbalance = None
+        self.cpu = None
 
-    def add_output(self, fn):
-        output = Output(self.metadata['benchmark'], fn)
+    # data holds the file's contents when it comes from a tarball
+    def add_output(self, fn, data=None):
+        # Histograms are only built when asked for or when they will be persisted in the cache
+        if PROFILER:
+            start = time.perf_counter()
+            with PROFILER.phase('parse'):
+                output = Output(self.metadata['benchmark'], fn, self.ctx.lean_json, self.ctx.hist or bool(self.ctx.cache), data)
+            PROFILER.add_file(fn, time.perf_counter() - start, None if data is None else len(data))
+        else:
+            output = Output(self.metadata['benchmark'], fn, self.ctx.lean_json, self.ctx.hist or bool(self.ctx.cache), data)
         self.outputs.append(output)
 
     def calculate_results(self):
@@ -94,128 +1313,256 @@ class Test(object):
             return
         self.iops = sum([item.iops for item in self.outputs])
         self.bw = sum([item.bw for item in self.outputs])
+        if self.ctx.imbalance:
+            self.calculate_imbalance()
+        # Like histograms, the counters are also summed when they will be persisted in the cache
+        if self.ctx.cpu or self.ctx.cache:
+            self.calculate_cpu()
         if self.metadata['benchmark'] == 'fio' or self.metadata['benchmark'] == 'librbdfio':
             self.read_iops = sum([item.read_iops for item in self.outputs])
             self.write_iops = sum([item.write_iops for item in self.outputs])
             self.read_bw = sum([item.read_bw for item in self.outputs])
             self.write_bw = sum([item.write_bw for item in self.outputs])
 
+            read_weights = [item.read_iops for item in self.outputs]
+            write_weights = [item.write_iops for item in self.outputs]
             if not self.read_iops == 0:
-                for key in self.outputs[0].read_lat.keys():
-                    try:
-                        self.read_lat[key] = np.ma.average([item.read_lat[key] for item in self.outputs], weights=[item.read_iops for item in self.outputs])
-                        self.read_lat[key] /= 1000000
-                    except KeyError:
-                        continue
+                for key, value in self.average_outputs(LAT_READ, read_weights).items():
+                    self.read_lat[key] = value / 1000000
             else:
-                for key in self.outputs[0].write_lat.keys():
-                    try:
-                        self.lat[key] = np.ma.average([item.write_lat[key] for item in self.outputs], weights=[item.write_iops for item in self.outputs])
-                        self.read_lat[key] = 0
-                        self.lat[key] /= 1000000
-                    except KeyError:
-                        continue
+                for key, value in self.average_outputs(LAT_WRITE, write_weights).items():
+                    self.lat[key] = value / 1000000
+                    self.read_lat[key] = 0
 
             if not self.write_iops == 0:
-                for key in self.outputs[0].write_lat.keys():
-                    try:
-                        self.write_lat[key] = np.ma.average([item.write_lat[key] for item in self.outputs], weights=[item.write_iops for item in self.outputs])
-                        self.write_lat[key] /= 1000000
-                    except KeyError:
-                        continue
+                for key, value in self.average_outputs(LAT_WRITE, write_weights).items():
+                    self.write_lat[key] = value / 1000000
             else:
-                for key in self.outputs[0].read_lat.keys():
-                    try:
-                        self.lat[key] = np.ma.average([item.read_lat[key] for item in self.outputs], weights=[item.read_iops for item in self.outputs])
-                        self.write_lat[key] = 0
-                        self.lat[key] /= 1000000
-                    except KeyError:
-                        continue
+                for key, value in self.average_outputs(LAT_READ, read_weights).items():
+                    self.lat[key] = value / 1000000
+                    self.write_lat[key] = 0
 
             if not self.read_iops == 0 and not self.write_iops == 0:
-                for key in self.outputs[0].read_lat.keys():
-                    try:
-                        self.lat[key] = np.ma.average([self.read_lat[key], self.write_lat[key]], weights=[self.read_iops, self.write_iops])
-                    except KeyError:
-                        continue
+                self.lat.update(weighted_average([self.read_lat, self.write_lat], [self.read_iops, self.write_iops], self.outputs[0].read_lat.keys()))
+
+            # Histograms of all jobs, volumes and clients add up bucket by bucket
+            if all(item.read_hist is not None for item in self.outputs):
+                self.read_hist = np.sum([item.read_hist for item in self.outputs], axis=0)
+                self.write_hist = np.sum([item.write_hist for item in self.outputs], axis=0)
+            # Per-output histograms are 30KB each and no longer needed once merged
+            for item in self.outputs:
+                item.read_hist = item.write_hist = None
+            self.calculate_pctiles()
 
         elif self.metadata['benchmark'] == 'Radosbench':
             if not self.iops == 0:
-                for key in self.outputs[0].lat.keys():
-                    try:
-                        self.lat[key] = np.ma.average([item.lat[key] for item in self.outputs], weights=[item.iops for item in self.outputs])
-                        self.lat[key] /= 1000000
-                    except KeyError:
-                        continue
+                for key, value in self.average_outputs(LAT_ALL, [item.iops for item in self.outputs]).items():
+                    self.lat[key] = value / 1000000
+                # The extremes of the cluster are those of its clients, not their average
+                self.lat['min'] = min(item.lat['min'] for item in self.outputs) / 1000000
+                self.lat['max'] = max(item.lat['max'] for item in self.outputs) / 1000000
         else:
             print('Unknown benchmark!')
 
-    def printTest(self):
-        if self.ctx.pctiles:
-            if self.ctx.split:
-                sys.stdout.write('%s, %s, %s, %s, %s, %s, %s, %s, %s, %d, %d, %d, %.2f, %.2f, %.2f, %.2f' % (self.dn, self.hashid, self.metadata['benchmark'], self.metadata['iteration'], self.clients,
-                    self.metadata['op_size'], self.metadata['mode'], self.metadata['rwmixread'],
-                    self.metadata['iodepth'], self.bw, self.read_iops, self.write_iops, self.read_lat['avg'], self.write_lat['avg'],
-                    self.read_lat['min'], self.write_lat['min']))
-                for bucket in self.ctx.pctiles.split(','):
-                    try:
-                        sys.stdout.write(', %.2f, %.2f' % (self.read_lat[float(bucket)], self.write_lat[float(bucket)]))
-                    except KeyError:
-                        continue
-                print(', %.2f, %.2f' % (self.read_lat['max'], self.write_lat['max']))
-            else:
-                sys.stdout.write('%s, %s, %s, %s, %s, %s, %s, %s, %s, %d, %d, %.2f, %.2f' % (self.dn, self.hashid, self.metadata['benchmark'], self.metadata['iteration'], self.clients,
-            self.metadata['op_size'], self.metadata['mode'], self.metadata['rwmixread'], 
-            self.metadata['iodepth'], self.bw, self.iops, self.lat['avg'], self.lat['min']))
-#                print(self.lat.keys())
-                for bucket in self.ctx.pctiles.split(','):
-                    try:
-                        sys.stdout.write(', %.2f' % self.lat[float(bucket)])
-                    except KeyError:
-                        continue
-                print(', %.2f' % self.lat['max'])
+    # Per-output (volume) IOPS and p99 latency as arrays, and how evenly the load is spread over
+    # volumes and over clients (the volumes of a host summed). With --hist p99 comes from each
+    # output's histogram, else from the percentiles fio reported.
+    def calculate_imbalance(self):
+        iops = np.array([item.iops for item in self.outputs], dtype=np.float64)
+        if self.ctx.hist and all(item.read_hist is not None for item in self.outputs):
+            cum = np.cumsum(np.stack([item.read_hist + item.write_hist for item in self.outputs]), axis=1)
+            p99 = plat_idx_to_val((cum < 0.99 * cum[:, -1:]).sum(axis=1)) / 1000000.0
+            p99[cum[:, -1] == 0] = np.nan
         else:
-            if self.ctx.split:
-                sys.stdout.write('%s, %s, %s, %s, %s, %s, %s, %s, %s, %d, %d, %d, %.2f, %.2f, %.2f, %.2f' % (self.dn, self.hashid, self.metadata['benchmark'], self.metadata['iteration'], self.clients,
-                self.metadata['op_size'], self.metadata['mode'], self.metadata['rwmixread'],
-                self.metadata['iodepth'], self.bw, self.read_iops, self.write_iops, self.read_lat['avg'], self.write_lat['avg'],
-                self.read_lat['min'], self.write_lat['min']))
-                print(', %.2f, %.2f' % (self.read_lat['max'], self.write_lat['max']))
-            else:
-                sys.stdout.write('%s, %s, %s, %s, %s, %s, %s, %s, %s, %d, %d, %.2f, %.2f' % (self.dn, self.hashid, self.metadata['benchmark'], self.metadata['iteration'], self.clients,
-            self.metadata['op_size'], self.metadata['mode'], self.metadata['rwmixread'],
-            self.metadata['iodepth'], self.bw, self.iops, self.lat['avg'], self.lat['min']))
-                print(', %.2f' % self.lat['max'])
-                
+            p99 = np.array([item.lat.get(99.0, np.nan) for item in self.outputs]) / 1000000
+        names = [JSON_OUTPUT_NAME.match(os.path.basename(item.fn)) for item in self.outputs]
+        volumes = [(m.group('host'), int(m.group('volume'))) if m else (os.path.basename(item.fn), 0) for m, item in zip(names, self.outputs)]
+        hosts, client = np.unique([host for host, volume in volumes], return_inverse=True)
+        client_iops = np.bincount(client, weights=iops, minlength=len(hosts))
+        client_p99 = np.full(len(hosts), np.nan)
+        np.fmax.at(client_p99, client, p99)
+
+        slow = mad_low_outliers(iops, self.ctx.mad_z) | iqr_high_outliers(p99, self.ctx.iqr_k)
+        slow_clients = mad_low_outliers(client_iops, self.ctx.mad_z) | iqr_high_outliers(client_p99, self.ctx.iqr_k)
+        valid_p99 = p99[~np.isnan(p99)]
+        self.imbalance = {'fairness': jain_index(iops), 'client_fairness': jain_index(client_iops),
+            'iops_cv': iops.std() / iops.mean() * 100 if iops.mean() else 0,
+            'p99_spread': valid_p99.max() / np.median(valid_p99) if len(valid_p99) and np.median(valid_p99) > 0 else 0,
+            'stragglers': int(slow.sum()), 'slow_clients': ';'.join(hosts[slow_clients]),
+            'slow_volumes': ';'.join('%s:%d' % volume for volume in sorted(volume for volume, flagged in zip(volumes, slow) if flagged))}
+
+    # Client CPU counters of all outputs added up, the busiest device any client saw, and what the
+    # IOs cost: IOPS per percent of a CPU, CPU microseconds and context switches per completed IO
+    def calculate_cpu(self):
+        if any(item.cpu is None for item in self.outputs):
+            return
+        cpu = dict(zip(CPU_COUNTERS, np.sum([item.cpu for item in self.outputs], axis=0).tolist()))
+        cpu['disk_util'] = max(item.disk_util for item in self.outputs)
+        busy = cpu['usr_cpu'] + cpu['sys_cpu']
+        cpu['iops_per_cpu'] = self.iops / busy if busy > 0 else 0
+        cpu['cpu_per_io'] = cpu['cpu_time'] * 1000000 / cpu['ios'] if cpu['ios'] > 0 else 0
+        cpu['ctx_per_io'] = cpu['ctx'] / cpu['ios'] if cpu['ios'] > 0 else 0
+        self.cpu = cpu
+
+    # IOPS-weighted mean latency (ns) of one Output.lats row across all outputs. Outputs sharing a
+    # key layout are stacked straight into the kernel's matrix; keys any output lacks are left out.
+    def average_outputs(self, row, weights):
+        keys = self.outputs[0].keys
+        if any(item.keys is not keys for item in self.outputs):
+            return weighted_average([item.lat_dict(row) for item in self.outputs], weights)
+        matrix = np.stack([item.lats[row] for item in self.outputs], axis=1)
+        valid = ~np.isnan(matrix).any(axis=1)
+        return dict(zip([key for key, ok in zip(keys, valid) if ok], weighted_mean(matrix[valid], weights)))
+
+    # Answer the requested percentiles from the merged histograms instead of averaging per-job percentiles
+    def calculate_pctiles(self):
+        if not self.ctx.hist or not self.ctx.pctiles or self.read_hist is None:
+            return
+        self.pctiles = self.percentiles([float(bucket) for bucket in self.ctx.pctiles.split(',')])
+
+    # {'read'|'write'|'all': {bucket: ms}} from the merged histograms, None without them
+    def percentiles(self, buckets):
+        if self.read_hist is None:
+            return None
+        return {'read': dict(zip(buckets, hist_percentiles(self.read_hist, buckets))),
+            'write': dict(zip(buckets, hist_percentiles(self.write_hist, buckets))),
+            'all': dict(zip(buckets, hist_percentiles(self.read_hist + self.write_hist, buckets)))}
+
+    # Build the cluster timeline from the fio logs (or rados bench outputs) in a test dir and
+    # summarize its steady state
+    def load_timeline(self, path, logs=None):
+        names = os.listdir(path) if logs is None else logs
+        if self.metadata['benchmark'] == 'Radosbench':
+            self.timeline = Timeline(1000)
+            for fn in sorted(names):
+                if RADOS_OUTPUT.match(fn):
+                    # Outputs read from a tarball are already parsed
+                    progress = logs[fn] if isinstance(logs, dict) else read_rados_progress(read_text(os.path.join(path, fn)))
+                    self.timeline.add_rados(progress)
+        else:
+            volumes = defaultdict(dict)
+            for fn in names:
+                m = FIO_LOG.match(fn)
+                if m:
+                    # Logs read from a tarball are already parsed
+                    log = logs[fn] if isinstance(logs, dict) else os.path.join(path, fn)
+                    volumes[(m.group('prefix'), m.group('job'), m.group('host'))][m.group('kind')] = log
+            self.timeline = Timeline(self.metadata.get('log_avg_msec') or 1000)
+            for key in sorted(volumes):
+                self.timeline.add_volume(volumes[key])
+        skip = self.ctx.skip * 1000
+        if skip and skip // self.timeline.step >= len(self.timeline.iops) > 0:
+            sys.stderr.write('Test %s: --skip %gs leaves no timeline samples (%gs logged)\n'
+                % (self.hashid, self.ctx.skip, len(self.timeline.iops) * self.timeline.step / 1000.0))
+        self.steady = self.timeline.steady_state(skip)
+
+    # Summary values in output_columns() order. serve_cbt.py passes the options and percentiles of
+    # each query instead of the Test's own.
+    def row(self, ctx=None, pctiles=None):
+        ctx = ctx or self.ctx
+        pctiles = pctiles or self.pctiles
+        read_pct, write_pct, pct = getattr(self, 'read_lat', None), getattr(self, 'write_lat', None), self.lat
+        if pctiles:
+            read_pct, write_pct, pct = pctiles['read'], pctiles['write'], pctiles['all']
+        buckets = [float(bucket) for bucket in ctx.pctiles.split(',')] if ctx.pctiles else []
+        row = [self.dn, self.hashid, self.metadata['benchmark'], self.metadata['iteration'], self.clients, self.metadata['op_size'],
+            self.metadata['mode'], self.metadata['rwmixread'], self.metadata['iodepth'], self.bw]
+        if ctx.split:
+            row += [self.read_iops, self.write_iops, self.read_lat['avg'], self.write_lat['avg'], self.read_lat['min'], self.write_lat['min']]
+            for bucket in buckets:
+                if bucket in read_pct and bucket in write_pct:
+                    row += [read_pct[bucket], write_pct[bucket]]
+                else:
+                    row += [None, None]
+            row += [self.read_lat['max'], self.write_lat['max']]
+        else:
+            row += [self.iops, self.lat['avg'], self.lat['min']]
+            for bucket in buckets:
+                row.append(pct.get(bucket))
+            row.append(self.lat['max'])
+        if ctx.timeline:
+            steady = self.steady or NO_STEADY_STATE
+            row += [steady['iops'], steady['iops_stdev'], steady['jitter'], steady['bw'], steady['lat'],
+                steady['stalls'], steady['max_stall']]
+        if ctx.imbalance:
+            imbalance = self.imbalance or NO_IMBALANCE
+            row += [imbalance['fairness'], imbalance['client_fairness'], imbalance['iops_cv'], imbalance['p99_spread'],
+                imbalance['stragglers'], imbalance['slow_clients'], imbalance['slow_volumes']]
+        if ctx.cpu:
+            cpu = self.cpu or NO_CPU
+            row += [cpu['usr_cpu'], cpu['sys_cpu'], cpu['ctx'], cpu['majf'], cpu['minf'], cpu['disk_util'],
+                cpu['iops_per_cpu'], cpu['cpu_per_io'], cpu['ctx_per_io']]
+        return row
+
+# Rows of Output.lats
+LAT_ALL = 0
+LAT_READ = 1
+LAT_WRITE = 2
+
+# Interned latency key layouts ('avg', 'min', 'max', <percentiles>...) and their column index.
+# Outputs reporting the same fio percentile list share one tuple, which lets a Test stack their
+# latency rows into a matrix without going through per-key dicts.
+LAT_LAYOUTS = {}
+
+def lat_layout(keys):
+    keys = tuple(keys)
+    if keys not in LAT_LAYOUTS:
+        LAT_LAYOUTS[keys] = (keys, dict((key, i) for i, key in enumerate(keys)))
+    return LAT_LAYOUTS[keys]
+
 class Output(object):
-    def __init__(self, benchmark, fn):
+    # Slotted with one (3 x keys) float array for the combined/read/write latencies (ns); NaN marks
+    # a key the direction did not report
+    __slots__ = ('benchmark', 'fn', 'iops', 'bw', 'read_iops', 'write_iops', 'read_bw', 'write_bw', 'keys', 'lats', 'read_hist', 'write_hist',
+        'cpu', 'disk_util')
+
+    def __init__(self, benchmark, fn, lean_json=False, hist=False, data=None):
         self.benchmark = benchmark
         self.fn = fn
+        self.read_hist = None
+        self.write_hist = None
         self.iops = 0
         self.bw = 0
-        self.lat = {'avg': 0, 'min': 0, 'max': 0}
+        self.read_iops = 0
+        self.write_iops = 0
+        self.read_bw = 0
+        self.write_bw = 0
+        self.keys = lat_layout(('avg', 'min', 'max'))[0]
+        self.lats = np.zeros((3, 3))
+        # CPU_COUNTERS of the fio jobs and the highest utilization (%) of the client's devices
+        self.cpu = None
+        self.disk_util = 0
         if self.benchmark == 'fio' or self.benchmark == 'librbdfio':
-            self.read_lat = {'avg': 0, 'min': 0, 'max': 0}
-            self.write_lat = {'avg': 0, 'min': 0, 'max': 0}
-            self.read_iops = 0
-            self.write_iops = 0
-            self.read_bw = 0
-            self.write_bw = 0
-            self.parse_fio(fn)
+            self.parse_fio(fn, lean_json, hist, data)
         elif self.benchmark == 'Radosbench':
-            self.parse_rados_bench(fn)
+            self.parse_rados_bench(fn, data)
         else:
             print('Unknown benchmark!')
 
-    def parse_rados_bench(self, fn):
-        json_data = json.load(open(fn))
+    # Latency row as a {key: ns} dict, leaving out keys the direction did not report
+    def lat_dict(self, row):
+        return dict((key, value) for key, value in zip(self.keys, self.lats[row].tolist()) if value == value)
+
+    @property
+    def lat(self):
+        return self.lat_dict(LAT_ALL)
+
+    @property
+    def read_lat(self):
+        return self.lat_dict(LAT_READ)
+
+    @property
+    def write_lat(self):
+        return self.lat_dict(LAT_WRITE)
+
+    # rados bench reports MB/s and seconds; the columns are KB/s and, like fio, latencies are kept in ns
+    def parse_rados_bench(self, fn, data=None):
+        json_data = json.loads(read_text(fn, data))
         self.iops = json_data['Average IOPS']
-        self.bw = json_data['Bandwidth (MB/sec)']
-        self.lat['avg'] = json_data['Average Latency(s)']
-        self.lat['min'] = json_data['Min latency(s)']
-        self.lat['max'] = json_data['Max latency(s)']
+        self.bw = json_data['Bandwidth (MB/sec)'] * 1000
+        self.lats[LAT_ALL] = np.array([json_data['Average Latency(s)'], json_data['Min latency(s)'], json_data['Max latency(s)']]) * 1e9
 
-    def parse_fio(self, fn):
+    def parse_fio(self, fn, lean_json=False, hist=False, data=None):
         read_job_iops = []
         write_job_iops = []
         read_job_bw = []
@@ -225,8 +1572,16 @@ class Output(object):
         lat_key = 'lat_ns'
         clat_key = 'clat_ns'
 
-        json_data = json.load(open(fn))
-        for job in json_data['jobs']:
+        if lean_json:
+            output = load_fio_json(fn, hist, data)
+        else:
+            output = json.loads(read_text(fn, data))
+        jobs = output['jobs']
+        # Merge the per-job clat histograms when every job with IOs carries json+ bins
+        if hist and all('bins' in job[ddir][clat_key] or job[ddir]['iops'] == 0 for job in jobs for ddir in ('read', 'write')):
+            self.read_hist = np.sum([bins_to_hist(job['read'][clat_key].get('bins', {})) for job in jobs], axis=0)
+            self.write_hist = np.sum([bins_to_hist(job['write'][clat_key].get('bins', {})) for job in jobs], axis=0)
+        for job in jobs:
             read_job_iops.append(int(job['read']['iops']))
             write_job_iops.append(int(job['write']['iops']))
             read_job_bw.append(job['read']['bw'])
@@ -251,98 +1606,120 @@ class Output(object):
         self.write_bw = sum(write_job_bw)
         self.bw = self.read_bw + self.write_bw
 
+        # usr/sys are percent of one CPU over the job's runtime (ms); older fio only has it per direction
+        cpu = np.zeros(len(CPU_COUNTERS))
+        for job in jobs:
+            runtime = job.get('job_runtime') or max(job['read'].get('runtime', 0), job['write'].get('runtime', 0))
+            ios = job['read'].get('total_ios', 0) + job['write'].get('total_ios', 0)
+            cpu += [job.get('usr_cpu', 0), job.get('sys_cpu', 0), job.get('ctx', 0), job.get('majf', 0), job.get('minf', 0),
+                (job.get('usr_cpu', 0) + job.get('sys_cpu', 0)) * runtime / 100000.0, ios]
+        self.cpu = cpu
+        # librbd clients have no block devices and no disk_util section
+        self.disk_util = max([disk['util'] for disk in output.get('disk_util', [])] or [0])
+
+        keys = ['avg', 'min', 'max']
+        for key in list(read_job_lat.keys()) + list(write_job_lat.keys()):
+            if key not in keys:
+                keys.append(key)
+        self.keys, index = lat_layout(keys)
+        read_cols = [index[key] for key in read_job_lat.keys()]
+        write_cols = [index[key] for key in write_job_lat.keys()]
+        read_matrix = np.array(list(read_job_lat.values()), dtype=np.float64).reshape(len(read_cols), -1)
+        write_matrix = np.array(list(write_job_lat.values()), dtype=np.float64).reshape(len(write_cols), -1)
+        self.lats = np.full((3, len(self.keys)), np.nan)
+        self.lats[:, :3] = 0
+
         if not self.read_iops == 0:
-            for key in read_job_lat.keys():
-                self.read_lat[key] = np.ma.average(read_job_lat[key], weights=read_job_iops)
+            self.lats[LAT_READ, read_cols] = weighted_mean(read_matrix, read_job_iops)
         else:
-            for key in write_job_lat.keys():
-                self.lat[key] = np.ma.average(write_job_lat[key], weights=write_job_iops)
+            self.lats[LAT_ALL, write_cols] = weighted_mean(write_matrix, write_job_iops)
         if not self.write_iops == 0:
-            for key in write_job_lat.keys():
-                self.write_lat[key] = np.ma.average(write_job_lat[key], weights=write_job_iops)
+            self.lats[LAT_WRITE, write_cols] = weighted_mean(write_matrix, write_job_iops)
         else:
-            for key in read_job_lat.keys():
-                self.lat[key] = np.ma.average(read_job_lat[key], weights=read_job_iops)
+            self.lats[LAT_ALL, read_cols] = weighted_mean(read_matrix, read_job_iops)
         if not self.read_iops == 0 and not self.write_iops == 0:
-            for key in read_job_lat.keys():
-                self.lat[key] = np.ma.average([self.read_lat[key], self.write_lat[key]], weights=[self.read_iops, self.write_iops])
-
+            matrix = np.ascontiguousarray(self.lats[LAT_READ:, read_cols].T)
+            valid = ~np.isnan(matrix).any(axis=1)
+            self.lats[LAT_ALL, np.array(read_cols)[valid]] = weighted_mean(matrix[valid], [self.read_iops, self.write_iops])
 
 if __name__ == '__main__':
     ctx = parse_args()
 
     cbtConfig = {}
 
-    sqlite_file = '/tmp/db.sqlite'
-    #conn = sqlite3.connect(sqlite_file)
-    #c = conn.cursor()
-    q = 'CREATE TABLE if not exists results ('
-    values = []
-    FORMAT = ['hash', 'testname', 'benchmark', 'iteration', 'procs', 'iosize', 'pattern', 'mix', 'iodepth', 'bandwidth', 'iops', 'avglat']
-    TYPES = {'hash': 'text', 'testname': 'text', 'benchmark': 'text', 'iteration': 'integer', 'procs': 'integer', 
-         'iosize': 'integer', 'pattern': 'text', 'mix': 'integer', 'iodepth': 'integer', 'bandwidth': 'integer', 'iops': 'real', 'avglat': 'real'}
-    for key in FORMAT:
-        values.append('%s %s' % (key,TYPES[key]))
-    q += ', '.join(values)+', PRIMARY KEY (hash, testname))'
-    #c.execute(q)
-    #conn.commit()
-
-    print_header(ctx)
-
-    # Iterate through each given archive directory
-    for dn in ctx.DIR:
-        # List of test objects in CBT archive folder
-        tests = []
-        testIndex = -1
-
-        # Walk through given directory
-        for path, dirs, files in os.walk(dn):
-            for filename in files:
-                fname = os.path.join(path,filename)
-                # If we see a CBT config, we're in the CBT archive folder
-                if 'cbt_config.yaml' in fname:
-                    with open(fname, 'r') as stream:
-                        cbtConfig = yaml.load(stream)
-
-                # If we see a benchmark config, we're in a test output dir
-                if 'benchmark_config.yaml' in fname:
-                    with open(fname, 'r') as stream:
-                        benchConfig = yaml.load(stream)
-                        # Create new Test object with current benchmark metadata
-                        for subdir in path.split('/'):
-                            if re.match('id', subdir):
-                                hashid = subdir
-                        tests.append(Test(ctx, dn, benchConfig['cluster'], hashid))
-                        testIndex+=1
-
-                    #Gather all output files in this test directory
-                    outputs = sorted((os.path.join(path, f) for f in os.listdir(path)), key=os.path.getctime)
-                    for json_file in outputs:
-                        # Only add/parse from json fio files
-                        if 'json_output' in json_file:
-                            # Check if file contains any data
-                            if os.path.getsize(json_file) > 0:
-                                # Add json data to test outputs
-                                tests[testIndex].add_output(json_file)
-                            else:
-                                #Found corrupted/empty JSON file
-                                print('%s is empty' % json_file)
-                    # Calculate test statistics from outputs
-                    tests[testIndex].calculate_results()
-
-        tests.sort(key=lambda x: (x.metadata['benchmark'], x.metadata['rwmixread'], x.clients, x.metadata['op_size'], x.metadata['iteration'], x.metadata['iodepth']))
-#        tests.sort(key=lambda x: (x.metadata['benchmark'], x.metadata['rwmixread'], x.clients, x.metadata['op_size'], x.metadata['iodepth'], x.metadata['iteration']))
-
-
-        for test in tests:
-            test.printTest()
-
-            values = (test.hashid, dn, test.metadata['benchmark'], int(test.metadata['iteration']), 
-                test.clients, int(test.metadata['op_size']), test.metadata['mode'], int(test.metadata['rwmixread']), int(test.metadata['iodepth']), test.bw, test.iops, test.lat['avg'])
-            #c = conn.cursor()
-            #c.execute('INSERT OR IGNORE INTO results VALUES(?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)', values)
-            #conn.commit()
-        #conn.close()
+    if ctx.profile:
+        PROFILER = Profiler()
+
+    cache = None
+    if ctx.cache:
+        with profile_phase('cache'):
+            cache = ResultCache(ctx.cache)
+
+    writer = make_writer(ctx, stats_columns(ctx) if ctx.stats else None)
+    writer.header()
+
+    index = ArchiveIndex(ctx.manifest)
+
+    pool = None
+    workers = 1
+    if ctx.jobs != 1 and not ctx.follow:
+        workers = ctx.jobs or multiprocessing.cpu_count()
+        pool = multiprocessing.Pool(workers)
+
+    # Summarize test dirs as they complete until interrupted
+    if ctx.follow:
+        try:
+            follow_archives(ctx, writer, cache)
+        except KeyboardInterrupt:
+            pass
+    else:
+        # Tests of all archives, kept for --stats
+        everything = []
+        # Iterate through each given archive directory
+        for dn in ctx.DIR:
+            # List of test objects in CBT archive folder
+            if ctx.stats:
+                everything.extend(load_archive(ctx, dn, index, cache, pool, workers))
+                continue
+            # With a memory budget no Test is kept: rows are sorted on disk as they come
+            if ctx.memory_budget:
+                sorter = writer if ctx.no_sort else SortingWriter(writer, output_columns(ctx), ctx.memory_budget * 1048576 / 2)
+                load_archive(ctx, dn, index, cache, pool, workers, sorter, keep=False)
+                with profile_phase('sort'):
+                    sorter.flush()
+                continue
+            tests = load_archive(ctx, dn, index, cache, pool, workers, writer if ctx.no_sort else None)
+
+            # Unless rows were streamed in walk order, write the archive's tests sorted
+            if not ctx.no_sort:
+                with profile_phase('sort'):
+                    tests.sort(key=lambda x: (x.metadata['benchmark'], x.metadata['rwmixread'], x.clients, x.metadata['op_size'], x.metadata['iteration'], x.metadata['iodepth']))
+#                tests.sort(key=lambda x: (x.metadata['benchmark'], x.metadata['rwmixread'], x.clients, x.metadata['op_size'], x.metadata['iodepth'], x.metadata['iteration']))
+
+                with profile_phase('output'):
+                    for test in tests:
+                        writer.write(test.row())
+            writer.flush()
+
+        if ctx.stats:
+            with profile_phase('stats'):
+                for row in stats_rows(ctx, everything):
+                    writer.write(row)
+
+    if pool:
+        pool.close()
+        pool.join()
+    if cache:
+        cache.close()
+    index.save()
+    writer.close()
+
+    if PROFILER:
+        report = PROFILER.report(ctx.profile_top)
+        PROFILER.print_report(report)
+        if ctx.profile_json:
+            with open(ctx.profile_json, 'w') as f:
+                json.dump(report, f, indent=2)
 
 
 
@@ -0,0 +1,338 @@
+#!/usr/bin/python
+#
+# Local query service over parsed CBT results: archives are parsed once, kept in memory and
+# indexed, and filtered, sorted summaries are served over HTTP (or a Unix socket) with any
+# -p/-s options, without walking or parsing the archives again
+#
+#   ./serve_cbt.py --port 8642 -w /archives
+#   curl 'http://127.0.0.1:8642/tests?benchmark=librbdfio&op_size=4096,65536&pctiles=50.00,99.00&sort=-iops'
+#   ./serve_cbt.py --socket /tmp/cbt.sock -a="--hist --cache" /archives/run1 /archives/run2.tar.gz
+#   curl --unix-socket /tmp/cbt.sock 'http://cbt/tests?mode=randrw&split=1&format=jsonl'
+#
+# Endpoints:
+#   /tests    summary rows. Filters: archive, benchmark, mode, rwmixread, op_size, iodepth, clients,
+#             each a comma-separated list of values. Options: pctiles (as -p, 'default' for the
+#             -p defaults), split (as -s), sort (comma-separated fields, '-' for descending),
+#             limit, format (csv or jsonl)
+#   /keys     the indexed values of every filter, as JSON
+#   /status   archives, test count and time of the last refresh, as JSON
+#
+# Every archive DIR and every entry of a watched root (-w) is an archive. They are rescanned every
+# --interval seconds; only test dirs whose config or json outputs changed are parsed again, and new
+# or removed archives are picked up. With -a="--hist" percentiles come from the merged histograms.
+
+import os
+import sys
+import json
+import time
+import signal
+import argparse
+import threading
+import socketserver
+import multiprocessing
+from io import StringIO
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qs
+import numpy as np
+import parse_new_cbt
+import tarball
+
+def parse_args():
+    parser = argparse.ArgumentParser(description='Serve queries over parsed CBT results from memory.')
+    parser.add_argument('--host', dest='host', action='store', default='127.0.0.1', required=False, help='Address to listen on (default: 127.0.0.1).')
+    parser.add_argument('--port', dest='port', action='store', type=int, default=8642, required=False, help='TCP port to listen on (default: 8642).')
+    parser.add_argument('--socket', dest='socket', action='store', default=None, required=False, help='Listen on this Unix socket instead of TCP.')
+    parser.add_argument('-w', '--watch', dest='watch', action='append', default=[], required=False, help='Root whose entries (dirs and tarballs) are each an archive; new ones are added as they appear. Can be repeated.')
+    parser.add_argument('--interval', dest='interval', action='store', type=float, default=30, required=False, help='Seconds between rescans of the archives (default: 30).')
+    parser.add_argument('-a', '--args', dest='args', default='', help='Extra parse_new_cbt.py options, e.g. -a="--hist --cache".')
+    parser.add_argument('-j', '--jobs', dest='jobs', action='store', type=int, default=1, required=False, help='Parse test directories with N worker processes (0 = one per CPU).')
+    parser.add_argument('-v', '--verbose', dest='verbose', action='store_true', default=False, required=False, help='Log every request.')
+    parser.add_argument('DIR', help='CBT archive directory(s) or tarball(s) to serve', nargs='*')
+    args = parser.parse_args()
+    if not args.DIR and not args.watch:
+        parser.error('no archives or watched roots given')
+    return args
+
+# Indexed fields: the archive dir and the configuration of a test
+INDEX_KEYS = ('archive', 'benchmark', 'mode', 'rwmixread', 'op_size', 'iodepth', 'clients')
+
+def index_value(test, name):
+    if name == 'archive':
+        return test.dn
+    if name == 'clients':
+        return test.clients
+    return test.metadata.get(name)
+
+# Immutable snapshot of the served Tests with, for every indexed field, the positions of the Tests
+# holding each value. A refresh builds a new one and swaps it in, so queries never take a lock.
+class TestIndex(object):
+    def __init__(self, tests):
+        self.tests = tests
+        self.created = time.time()
+        self.postings = {}
+        for name in INDEX_KEYS:
+            postings = defaultdict(list)
+            for i, test in enumerate(tests):
+                postings[str(index_value(test, name))].append(i)
+            self.postings[name] = dict((value, np.array(ids, dtype=np.int64)) for value, ids in postings.items())
+
+    # Positions of the Tests matching every filter ({field: [values]}), in index order
+    def select(self, filters):
+        ids = np.arange(len(self.tests))
+        for name, values in filters.items():
+            postings = self.postings[name]
+            hits = np.concatenate([postings.get(value, np.zeros(0, dtype=np.int64)) for value in values])
+            ids = np.intersect1d(ids, hits)
+        return ids
+
+    # Values are indexed as strings; numbers are listed in numeric order
+    def keys(self):
+        def order(value):
+            try:
+                return (0, float(value), '')
+            except ValueError:
+                return (1, 0, value)
+        return dict((name, sorted(self.postings[name], key=order)) for name in INDEX_KEYS)
+
+# Parsed Tests of every served archive, refreshed in place: test dirs are rescanned with an
+# ArchiveIndex and re-parsed only when their fingerprint changed, the same change detector the
+# result cache uses. Tarballs are re-parsed whole when their size or mtime changes. All loading
+# happens on the watcher thread, which also owns the result cache's SQLite connection.
+class Store(object):
+    def __init__(self, ctx, args, pool=None, workers=1):
+        self.ctx = ctx
+        self.args = args
+        self.cache = None
+        self.pool = pool
+        self.workers = workers
+        # New tests appear deep below unchanged directories, so empty subtrees are not pruned
+        self.index = parse_new_cbt.ArchiveIndex(prune=False)
+        # Archive dir -> {hashid: (fingerprint, Test)}, tarball -> ((mtime, size), [Test])
+        self.archives = {}
+        self.view = TestIndex([])
+        self.refreshed = None
+
+    def archive_dirs(self):
+        dirs = list(self.args.DIR)
+        for root in self.args.watch:
+            if os.path.isdir(root):
+                dirs += sorted(os.path.join(root, name) for name in os.listdir(root) if not name.startswith('.'))
+        return [dn for dn in dirs if os.path.isdir(dn) or tarball.is_tarball(dn)]
+
+    # {hashid: (fingerprint, Test)} of an archive dir and the number of test dirs parsed again
+    def load_dir(self, dn, previous):
+        tests = {}
+        tasks = []
+        for test_dir in self.index.scan(dn):
+            if isinstance(test_dir, tuple):
+                continue
+            fp = parse_new_cbt.ResultCache.fingerprint(test_dir)
+            hashid = test_dir.hashid
+            if parse_new_cbt.reusable(self.ctx, previous, hashid, fp):
+                tests[hashid] = previous[hashid]
+                # Tests seeded from the result cache have no timeline yet
+                if self.ctx.timeline and tests[hashid][1].timeline is None:
+                    tests[hashid][1].load_timeline(test_dir.path, test_dir.logs)
+                continue
+            benchConfig = parse_new_cbt.load_config(os.path.join(test_dir.path, parse_new_cbt.BENCHMARK_CONFIG))
+            task = (self.ctx, dn, test_dir, benchConfig, hashid)
+            if self.pool:
+                tasks.append((task, fp))
+            else:
+                tests[hashid] = (fp, parse_new_cbt.load_test(*task))
+                if self.cache:
+                    self.cache.add(tests[hashid][1], fp)
+        if tasks:
+            chunksize = max(1, len(tasks) // (4 * self.workers))
+            results = self.pool.imap(parse_new_cbt.load_test_worker, [task for task, fp in tasks], chunksize=chunksize)
+            for (task, fp), (test, messages, profile) in zip(tasks, results):
+                sys.stdout.write(messages)
+                tests[test.hashid] = (fp, test)
+                if self.cache:
+                    self.cache.add(test, fp)
+        if self.cache:
+            self.cache.flush()
+        parsed = sum(1 for hashid, entry in tests.items() if previous.get(hashid) is not entry)
+        return tests, parsed
+
+    # Rescan every archive and swap in a new TestIndex if anything changed
+    def refresh(self):
+        changed = False
+        archives = {}
+        for dn in self.archive_dirs():
+            previous = self.archives.get(dn)
+            if tarball.is_tarball(dn):
+                st = os.stat(dn)
+                stamp = (st.st_mtime_ns, st.st_size)
+                if previous is None or previous[0] != stamp:
+                    previous = (stamp, parse_new_cbt.load_archive(self.ctx, dn, self.index, self.cache))
+                    changed = True
+                archives[dn] = previous
+                continue
+            if previous is None:
+                changed = True
+                # Seed a new archive from the result cache
+                previous = self.cache.load(self.ctx, dn) if self.cache else {}
+            tests, parsed = self.load_dir(dn, previous)
+            changed = changed or parsed > 0 or len(tests) != len(previous)
+            archives[dn] = tests
+        changed = changed or len(archives) != len(self.archives)
+        self.archives = archives
+        # Only directory listings are carried over; test dirs are restatted every pass since their
+        # outputs can change without changing the directory mtime
+        self.index.previous = dict((path, entry) for path, entry in self.index.dirs.items() if not entry['test'])
+        self.index.dirs = {}
+        if changed:
+            tests = []
+            for dn in sorted(archives):
+                if tarball.is_tarball(dn):
+                    tests.extend(archives[dn][1])
+                else:
+                    tests.extend(test for fp, test in archives[dn].values())
+            self.view = TestIndex([test for test in tests if test.clients])
+        self.refreshed = time.time()
+        return changed
+
+    def watch(self):
+        if self.ctx.cache:
+            self.cache = parse_new_cbt.ResultCache(self.ctx.cache)
+        start = time.time()
+        self.refresh()
+        sys.stderr.write('%d tests in %d archives loaded in %.1fs\n' % (len(self.view.tests), len(self.archives), time.time() - start))
+        while True:
+            time.sleep(self.args.interval)
+            try:
+                if self.refresh():
+                    sys.stderr.write('%d tests in %d archives\n' % (len(self.view.tests), len(self.archives)))
+            except Exception as e:
+                # A half-written archive must not stop the service; it is retried on the next pass
+                sys.stderr.write('refresh failed: %s\n' % e)
+
+# Query options as a parse_new_cbt ctx: the daemon's options with the query's -p/-s
+def query_ctx(ctx, params):
+    query = argparse.Namespace(**vars(ctx))
+    pctiles = params.get('pctiles', [None])[-1]
+    query.pctiles = '50.00,80.00,90.00,95.00,99.00' if pctiles == 'default' else pctiles or None
+    query.split = params.get('split', ['0'])[-1] not in ('0', 'false', '')
+    query.format = params.get('format', ['csv'])[-1]
+    return query
+
+# Default row order, as printed by parse_new_cbt.py
+def default_order(test):
+    return (test.metadata['benchmark'], test.metadata['rwmixread'], test.clients, test.metadata['op_size'], test.metadata['iteration'], test.metadata['iodepth'])
+
+def run_query(view, ctx, params):
+    query = query_ctx(ctx, params)
+    if query.format not in ('csv', 'jsonl'):
+        raise ValueError('unknown format %s' % query.format)
+    unknown = [name for name in params if name not in INDEX_KEYS + ('pctiles', 'split', 'sort', 'limit', 'format')]
+    if unknown:
+        raise ValueError('unknown parameter %s' % ', '.join(unknown))
+    filters = dict((name, ','.join(params[name]).split(',')) for name in INDEX_KEYS if name in params)
+    tests = [view.tests[i] for i in view.select(filters)]
+    tests.sort(key=default_order)
+
+    columns = parse_new_cbt.output_columns(query)
+    buckets = [float(bucket) for bucket in query.pctiles.split(',')] if query.pctiles else []
+    # Like parse_new_cbt.py, percentiles come from the merged histograms only with --hist; --cache
+    # builds them too, but otherwise the percentiles fio reported are served
+    pctiles = buckets and query.hist
+    rows = [test.row(query, test.percentiles(buckets) if pctiles else None) for test in tests]
+    # Stable sorts, least significant field first
+    fields = [field for field, header, fmt in columns]
+    for name in reversed(params.get('sort', [''])[-1].split(',') if params.get('sort') else []):
+        field = name.lstrip('-')
+        if field not in fields:
+            raise ValueError('unknown sort field %s' % field)
+        col = fields.index(field)
+        rows.sort(key=lambda row: (row[col] is None, row[col] if row[col] is not None else 0), reverse=name.startswith('-'))
+    if 'limit' in params:
+        rows = rows[:int(params['limit'][-1])]
+
+    out = StringIO()
+    writer = (parse_new_cbt.JsonLinesWriter if query.format == 'jsonl' else parse_new_cbt.CsvWriter)(out, columns)
+    writer.header()
+    for row in rows:
+        writer.write(row)
+    writer.flush()
+    return out.getvalue()
+
+class Handler(BaseHTTPRequestHandler):
+    store = None
+    verbose = False
+
+    def do_GET(self):
+        url = urlsplit(self.path)
+        params = parse_qs(url.query)
+        view = self.store.view
+        try:
+            if url.path == '/tests':
+                body, content_type = run_query(view, self.store.ctx, params), 'text/csv' if params.get('format', ['csv'])[-1] == 'csv' else 'application/x-ndjson'
+            elif url.path == '/keys':
+                body, content_type = json.dumps(view.keys(), default=str), 'application/json'
+            elif url.path == '/status':
+                body = json.dumps({'archives': sorted(self.store.archives), 'tests': len(view.tests),
+                    'indexed': view.created, 'refreshed': self.store.refreshed})
+                content_type = 'application/json'
+            else:
+                self.send_error(404)
+                return
+        except ValueError as e:
+            self.send_error(400, str(e))
+            return
+        data = body.encode()
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        if self.verbose:
+            sys.stderr.write('%s\n' % (format % args))
+
+class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    # BaseHTTPRequestHandler expects a (host, port) client address
+    def get_request(self):
+        request, address = socketserver.UnixStreamServer.get_request(self)
+        return request, ('local', 0)
+
+if __name__ == '__main__':
+    args = parse_args()
+    ctx = parse_new_cbt.parse_args([(args.DIR or args.watch)[0]] + args.args.split())
+    # Percentiles are chosen per query; the merged histograms are kept instead
+    ctx.pctiles = None
+    pool = None
+    workers = args.jobs or multiprocessing.cpu_count()
+    if workers != 1:
+        pool = multiprocessing.Pool(workers)
+
+    # Queries are answered from an empty index until the first load completes; see /status
+    store = Store(ctx, args, pool, workers)
+    watcher = threading.Thread(target=store.watch)
+    watcher.daemon = True
+    watcher.start()
+
+    Handler.store = store
+    Handler.verbose = args.verbose
+    if args.socket:
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = UnixHTTPServer(args.socket, Handler)
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), Handler)
+    # Shut down cleanly (and remove the socket) on SIGTERM as well as ^C
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.socket:
+            os.unlink(args.socket)
+        if pool:
+            pool.close()
@@ -0,0 +1,70 @@
+#
+# External sort for parse_cbt.py and parse_new_cbt.py --memory-budget: records are buffered
+# up to a byte budget, then sorted and written to a temporary file as one run. Iterating merges
+# the runs and whatever is still buffered back into key order, so output is the same as sorting
+# everything in memory, including the order of equal keys. Written to run under both Python 2
+# and Python 3.
+#
+# Orlando Moreno
+
+import heapq
+import pickle
+import tempfile
+
+class SpillSorter(object):
+	# Estimated bytes held per buffered record on top of its pickled size
+	OVERHEAD = 200
+	# Runs are merged into one when there are this many, to bound open files
+	MAX_RUNS = 64
+
+	def __init__(self, budget, dir=None):
+		self.budget = budget
+		self.dir = dir
+		self.buffer = []
+		self.size = 0
+		self.runs = []
+		self.seq = 0
+
+	def add(self, key, record):
+		data = pickle.dumps(record, 2)
+		# The sequence number keeps equal keys in arrival order and records from being compared
+		self.buffer.append((key, self.seq, data))
+		self.seq += 1
+		self.size += len(data) + self.OVERHEAD
+		if self.size >= self.budget:
+			self.spill()
+
+	def write_run(self, entries):
+		run = tempfile.TemporaryFile(dir=self.dir)
+		for entry in entries:
+			pickle.dump(entry, run, 2)
+		run.seek(0)
+		return run
+
+	def read_run(self, run):
+		try:
+			while True:
+				yield pickle.load(run)
+		except EOFError:
+			pass
+		finally:
+			run.close()
+
+	def spill(self):
+		self.buffer.sort()
+		self.runs.append(self.write_run(self.buffer))
+		self.buffer = []
+		self.size = 0
+		if len(self.runs) >= self.MAX_RUNS:
+			runs = self.runs
+			self.runs = [self.write_run(heapq.merge(*[self.read_run(run) for run in runs]))]
+
+	# Yield every record in key order and start over empty
+	def __iter__(self):
+		self.buffer.sort()
+		streams = [self.read_run(run) for run in self.runs] + [iter(self.buffer)]
+		self.buffer = []
+		self.size = 0
+		self.runs = []
+		for key, seq, data in heapq.merge(*streams):
+			yield pickle.loads(data)
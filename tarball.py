@@ -0,0 +1,51 @@
+#
+# Sequential reading of CBT archives stored as tarballs, used by parse_cbt.py and
+# parse_new_cbt.py in place of a walk over an extracted tree
+#
+# The compressed stream is read once, front to back. Members the caller does not
+# want (fio logs, collectl data, ...) are skipped over in the decompressed stream
+# and never written to disk. .tar.zst needs the zstandard module or the zstd
+# command. Written to run under both Python 2 and Python 3.
+#
+# Orlando Moreno
+
+import os
+import re
+import posixpath
+import subprocess
+import tarfile
+
+TARBALL = re.compile(r'\.(tar|tgz|tbz2|txz|tzst|tar\.gz|tar\.bz2|tar\.xz|tar\.zst|tar\.zstd)$')
+ZSTD = re.compile(r'\.(tzst|zst|zstd)$')
+
+def is_tarball(fn):
+	return bool(TARBALL.search(fn)) and os.path.isfile(fn)
+
+# Yield (member dir, file name, TarInfo, contents) for each regular file whose
+# name passes wanted(), in archive order
+def iter_members(fn, wanted):
+	proc = None
+	stream = None
+	if ZSTD.search(fn):
+		try:
+			import zstandard
+			stream = zstandard.ZstdDecompressor().stream_reader(open(fn, 'rb'))
+		except ImportError:
+			proc = subprocess.Popen(['zstd', '-dcq', fn], stdout=subprocess.PIPE)
+			stream = proc.stdout
+		tar = tarfile.open(fileobj=stream, mode='r|')
+	else:
+		tar = tarfile.open(fn, mode='r|*')
+	try:
+		for member in tar:
+			if not member.isfile():
+				continue
+			dirname, name = posixpath.split(member.name)
+			if wanted(name):
+				yield dirname, name, member, tar.extractfile(member).read()
+	finally:
+		tar.close()
+		if stream is not None:
+			stream.close()
+		if proc is not None:
+			proc.wait()
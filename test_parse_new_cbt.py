@@ -0,0 +1,23 @@
+#
+# Option checks of parse_new_cbt.py; run with python3 -m pytest
+#
+
+import subprocess
+import sys
+
+import pytest
+
+import parse_new_cbt
+
+def test_follow_rejects_stats(tmp_path, capsys):
+    with pytest.raises(SystemExit) as exit:
+        parse_new_cbt.parse_args([str(tmp_path), '--follow', '--stats'])
+    assert exit.value.code == 2
+    assert '--follow cannot be combined with --stats' in capsys.readouterr().err
+
+def test_follow_stats_command_line(tmp_path):
+    proc = subprocess.run([sys.executable, parse_new_cbt.__file__, str(tmp_path), '--follow', '--stats', '--idle', '1'],
+        stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True, timeout=60)
+    assert proc.returncode == 2
+    assert 'Traceback' not in proc.stderr
+    assert proc.stdout == ''